@@ -1,2 +1,4 @@
+from . import tools
+from . import controllers
 from . import models
-from . import wizards
\ No newline at end of file
+from . import wizards
@@ -1,6 +1,6 @@
 {
     'name': 'BO Billing',
-    'version': '1.0',
+    'version': '1.2',
     'category': 'Accounting',
     'summary': 'Módulo para gestionar la facturación electrónica en Bolivia.',
     'description': """
@@ -12,14 +12,26 @@
         'views/direccion_api_views.xml', 
         
         'views/cufd_views.xml', 
+        'views/catalogo_views.xml',
+        'views/emision_cola_views.xml',
+        'views/sucursal_views.xml',
         'wizards/account_move_reversal_view_inherit.xml',
         'wizards/contingencia_inicio_wizard.xml',
         
         'views/res_partner_view.xml',
         'views/product_template_form_inherit.xml',
         'views/account_move_form_inherit.xml',
+        'report/factura_report.xml',
+        'report/factura_templates.xml',
         
         'data/cufd_cron.xml',
+        'data/catalogo_cron.xml',
+        'data/emision_cola_cron.xml',
+        'data/cliente_sync_cron.xml',
+        'data/conexion_cron.xml',
+        'data/contingencia_sequence.xml',
+        'data/conciliacion_cron.xml',
+        'data/qr_cron.xml',
         
     ],
     
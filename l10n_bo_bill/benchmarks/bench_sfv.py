@@ -0,0 +1,262 @@
+"""Benchmark de extremo a extremo de los flujos SFV contra el servidor simulado.
+
+Se ejecuta fuera del servidor Odoo, sobre una base de datos desechable con
+el módulo y un plan contable instalados: el benchmark confirma facturas,
+clientes y productos, y deja activa su propia dirección de API::
+
+    python3 bench_sfv.py -c /etc/odoo/odoo.conf -d bench_db --facturas 200 --latencia-ms 80
+
+Por cada flujo informa unidades por segundo, latencia p50/p99 de las
+llamadas al SFV vistas desde el cliente y consultas SQL por unidad.
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_sfv  # noqa: E402
+
+import odoo  # noqa: E402
+from odoo import api, fields, SUPERUSER_ID  # noqa: E402
+
+FLUJOS = ('emision_unitaria', 'emision_lote', 'cola', 'contingencia', 'sync_clientes', 'sync_productos')
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class Medicion:
+    """Mide tiempo total, latencia de cada llamada al SFV y consultas SQL de un bloque."""
+
+    def __init__(self, sfv_client):
+        self.sfv_client = sfv_client
+        self.latencias = []
+        self.errores = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        original = self._original = self.sfv_client.request
+
+        def request(*args, **kwargs):
+            inicio = time.monotonic()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.latencias.append(time.monotonic() - inicio)
+
+        self.sfv_client.request = request
+        self._consultas = odoo.sql_db.sql_counter
+        self._inicio = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.monotonic() - self._inicio
+        self.consultas = odoo.sql_db.sql_counter - self._consultas
+        self.sfv_client.request = self._original
+        return False
+
+
+class Benchmark:
+
+    def __init__(self, env, args, url):
+        self.env = env
+        self.args = args
+        self.url = url
+        self.sfv_client = odoo.addons.l10n_bo_bill.tools.sfv_client
+        self.resultados = []
+
+    # --- preparación -------------------------------------------------------
+
+    def preparar(self):
+        env = self.env
+        direcciones = env['l10n_bo_bill.direccion_api'].search([])
+        direcciones.write({'activo': False})
+        self.direccion_api = env['l10n_bo_bill.direccion_api'].create({
+            'name': 'Benchmark SFV',
+            'url': self.url,
+            'tipo': 'computarizada',
+            'emision_asincrona': False,
+            'max_hilos_emision': self.args.hilos,
+        })
+        if not env.company.vat:
+            env.company.vat = '1020304050'
+
+        catalogo = env['l10n_bo_bill.catalogo']
+        for tipo in catalogo._ENDPOINTS:
+            catalogo._sincronizar(tipo)
+        env['l10n_bo_bill.cufd'].cron_renovar_cufd()
+
+        self.cliente = env['res.partner'].with_context(sfv_diferir_sync=True).create({
+            'name': 'Cliente Benchmark',
+            'vat': '1234567',
+            'codigo_cliente': 'BENCH-1',
+            'tipo_documento_identidad': '1',
+        })
+        self.cliente._sincronizar_sfv()
+        # ProductTemplate.create del módulo recibe un solo diccionario
+        self.productos = env['product.template']
+        for i in range(self.args.lineas):
+            self.productos |= env['product.template'].create({
+                'name': f'Producto Benchmark {i}',
+                'default_code': f'BENCH-{i}',
+                'list_price': 10.0 + i,
+                'unit_measure_code': '57',
+                'product_code': '83141',
+            })
+        env.cr.commit()
+
+    def _facturas(self, cantidad):
+        productos = self.productos.product_variant_ids
+        facturas = self.env['account.move'].create([{
+            'move_type': 'out_invoice',
+            'partner_id': self.cliente.id,
+            'invoice_date': fields.Date.today(),
+            'invoice_line_ids': [
+                (0, 0, {'product_id': producto.id, 'quantity': 1 + i % 3, 'price_unit': producto.lst_price})
+                for producto in productos
+            ],
+        } for i in range(cantidad)])
+        self.env.cr.commit()
+        return facturas
+
+    def _registrar(self, flujo, unidades, medicion, errores=0):
+        self.resultados.append({
+            'flujo': flujo,
+            'unidades': unidades,
+            'segundos': medicion.segundos,
+            'por_segundo': unidades / medicion.segundos if medicion.segundos else 0.0,
+            'p50_ms': percentil(medicion.latencias, 50) * 1000,
+            'p99_ms': percentil(medicion.latencias, 99) * 1000,
+            'consultas': medicion.consultas / unidades if unidades else 0.0,
+            'errores': errores,
+        })
+
+    # --- flujos ----------------------------------------------------------------
+
+    def emision_unitaria(self):
+        facturas = self._facturas(self.args.facturas)
+        errores = 0
+        with Medicion(self.sfv_client) as medicion:
+            for factura in facturas:
+                try:
+                    factura.action_envio_a_impuestos()
+                    self.env.cr.commit()
+                except Exception:
+                    self.env.cr.rollback()
+                    errores += 1
+        self._registrar('emision_unitaria', len(facturas), medicion, errores)
+
+    def emision_lote(self):
+        facturas = self._facturas(self.args.facturas)
+        with Medicion(self.sfv_client) as medicion:
+            resultados = facturas._emitir_lote()
+            self.env.cr.commit()
+        self._registrar('emision_lote', len(facturas), medicion, sum(1 for e in resultados.values() if e))
+
+    def cola(self):
+        facturas = self._facturas(self.args.facturas)
+        self.direccion_api.emision_asincrona = True
+        self.env.cr.commit()
+        with Medicion(self.sfv_client) as medicion:
+            facturas._encolar_emision()
+            self.env.cr.commit()
+            self.env['l10n_bo_bill.emision_cola']._cron_procesar_cola()
+        self.direccion_api.emision_asincrona = False
+        self.env.cr.commit()
+        errores = self.env['l10n_bo_bill.emision_cola'].search_count([
+            ('move_id', 'in', facturas.ids), ('state', '!=', 'hecho'),
+        ])
+        self._registrar('cola', len(facturas), medicion, errores)
+
+    def contingencia(self):
+        facturas = self._facturas(self.args.facturas)
+        self.env['account.move']._sincronizar_secuencia_contingencia()
+        self.direccion_api.write({'contingencia': True, 'evento_id': 1})
+        self.env.cr.commit()
+        with Medicion(self.sfv_client) as medicion:
+            resultados = facturas._emitir_contingencia_local()
+            self.env.cr.commit()
+            self.direccion_api.write({'contingencia': False, 'evento_id': False})
+            errores_paquete = self.env['account.move']._enviar_paquete_contingencia()
+            self.env.cr.commit()
+        errores = sum(1 for e in resultados.values() if e) + len(errores_paquete)
+        self._registrar('contingencia', len(facturas), medicion, errores)
+
+    def sync_clientes(self):
+        clientes = self.env['res.partner'].with_context(sfv_diferir_sync=True).create([{
+            'name': f'Cliente Benchmark {i}',
+            'vat': str(3000000 + i),
+            'codigo_cliente': f'BENCH-C{i}',
+            'tipo_documento_identidad': '1',
+        } for i in range(self.args.facturas)])
+        self.env.cr.commit()
+        with Medicion(self.sfv_client) as medicion:
+            clientes._sincronizar_sfv()
+        errores = self.env['res.partner'].search_count([('id', 'in', clientes.ids), ('sfv_sync_pendiente', '=', True)])
+        self._registrar('sync_clientes', len(clientes), medicion, errores)
+
+    def sync_productos(self):
+        productos = self.productos
+        with Medicion(self.sfv_client) as medicion:
+            for producto in productos:
+                producto.list_price += 1
+            self.env.cr.commit()
+        self._registrar('sync_productos', len(productos), medicion)
+
+    # --- reporte ---------------------------------------------------------------
+
+    def reporte(self):
+        columnas = ('flujo', 'unidades', 'segundos', 'por_segundo', 'p50_ms', 'p99_ms', 'consultas', 'errores')
+        print(" | ".join(f"{c:>16}" for c in columnas))
+        for fila in self.resultados:
+            print(" | ".join(
+                f"{fila[c]:>16.2f}" if isinstance(fila[c], float) else f"{fila[c]:>16}" for c in columnas
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', help="Archivo de configuración de Odoo")
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--facturas', type=int, default=100, help="Facturas (o clientes) por flujo")
+    parser.add_argument('--lineas', type=int, default=3, help="Líneas por factura")
+    parser.add_argument('--hilos', type=int, default=4, help="max_hilos_emision de la dirección de API")
+    parser.add_argument('--flujos', default=','.join(FLUJOS), help="Flujos separados por coma")
+    parser.add_argument('--latencia-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--tasa-error', type=float, default=0.0)
+    parser.add_argument('--mock-url', help="Usar un servidor simulado ya iniciado")
+    parser.add_argument('--verbose', action='store_true', help="Mantener el log de cada llamada al SFV")
+    args = parser.parse_args()
+
+    odoo_args = ['-d', args.database] + (['-c', args.config] if args.config else [])
+    odoo.tools.config.parse_config(odoo_args)
+    if not args.verbose:
+        logging.getLogger('odoo.addons.l10n_bo_bill').setLevel(logging.WARNING)
+
+    url = args.mock_url
+    if not url:
+        _servidor, url = mock_sfv.iniciar_en_hilo(
+            port=0, latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms, tasa_error=args.tasa_error,
+        )
+
+    registry = odoo.modules.registry.Registry(args.database)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        benchmark = Benchmark(env, args, url)
+        benchmark.preparar()
+        for flujo in args.flujos.split(','):
+            getattr(benchmark, flujo.strip())()
+        benchmark.reporte()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""Servidor HTTP que reemplaza a la API del SFV en pruebas de carga locales.
+
+Implementa los endpoints que usa el módulo con respuestas mínimas pero
+coherentes (números de factura por sucursal/punto de venta, ids de
+clientes e ítems, eventos de contingencia) y permite simular latencia,
+errores y caídas. No es parte del módulo de Odoo: se ejecuta aparte::
+
+    python3 mock_sfv.py --port 8899 --latencia-ms 120 --jitter-ms 40 --tasa-error 0.01
+
+La simulación puede cambiarse en caliente::
+
+    curl -X POST localhost:8899/_mock/config -d '{"caida": true}'
+    curl -X POST localhost:8899/_mock/config -d '{"fallar_siguientes": 2}'
+    curl localhost:8899/_mock/estadisticas
+
+``fallar_siguientes`` responde 503 a esa cantidad de peticiones y luego
+vuelve a la normalidad, para probar los reintentos de forma determinista.
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# PDF mínimo válido, devuelto por /pdf/download
+PDF_MINIMO = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+PARAMETROS = {
+    '/parametro/metodo-pago': [(1, 'EFECTIVO'), (2, 'TARJETA'), (7, 'TRANSFERENCIA BANCARIA')],
+    '/parametro/unidad-medida': [(57, 'UNIDAD (BIENES)'), (58, 'UNIDAD (SERVICIOS)'), (62, 'OTRO')],
+    '/parametro/identidad': [(1, 'CI - CEDULA DE IDENTIDAD'), (5, 'NIT - NÚMERO DE IDENTIFICACIÓN TRIBUTARIA')],
+    '/parametro/eventos-significativos': [(1, 'CORTE DEL SERVICIO DE INTERNET'), (2, 'INACCESIBILIDAD AL SERVICIO WEB')],
+    '/parametro/motivo-anulacion': [
+        (1, 'FACTURA MAL EMITIDA'), (2, 'NOTA DE CREDITO-DEBITO MAL EMITIDA'),
+        (3, 'DATOS DE EMISION INCORRECTOS'), (4, 'FACTURA O NOTA DE CREDITO-DEBITO DEVUELTA'),
+    ],
+}
+PRODUCTOS_SIN = [(83141, 'SERVICIOS DE CONSULTORÍA'), (61284, 'VENTA AL POR MENOR'), (87290, 'OTROS SERVICIOS')]
+
+
+class EstadoMock:
+    """Configuración de la simulación y datos emitidos; compartido entre hilos."""
+
+    def __init__(self, latencia_ms=0, jitter_ms=0, tasa_error=0.0, caida=False, fallar_siguientes=0):
+        self.config = {
+            'latencia_ms': latencia_ms,
+            'jitter_ms': jitter_ms,
+            'tasa_error': tasa_error,
+            'caida': caida,
+            'fallar_siguientes': fallar_siguientes,
+        }
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.numeros = {}
+        self.facturas = {}
+        self.estados = {}
+        self.estadisticas = {}
+        self.idempotentes = {}
+
+    def siguiente_numero(self, sucursal, punto_venta):
+        with self.lock:
+            numero = self.numeros.get((sucursal, punto_venta), 0) + 1
+            self.numeros[(sucursal, punto_venta)] = numero
+            return numero
+
+    def registrar(self, endpoint, status, segundos):
+        with self.lock:
+            fila = self.estadisticas.setdefault(endpoint, {'llamadas': 0, 'errores': 0, 'segundos': 0.0})
+            fila['llamadas'] += 1
+            fila['errores'] += int(status >= 500)
+            fila['segundos'] += segundos
+
+
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+
+
+class ManejadorSFV(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    estado = None
+
+    def log_message(self, formato, *args):
+        pass
+
+    # --- infraestructura -------------------------------------------------
+
+    def _cuerpo(self):
+        largo = int(self.headers.get('Content-Length') or 0)
+        if not largo:
+            return {}
+        try:
+            return json.loads(self.rfile.read(largo))
+        except ValueError:
+            return {}
+
+    def _responder(self, status, datos=None, contenido=None, tipo='application/json'):
+        if contenido is None:
+            contenido = json.dumps(datos if datos is not None else {}).encode()
+        self._ultima_respuesta = (status, contenido, tipo)
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+        return status
+
+    def _atender(self, metodo):
+        inicio = time.monotonic()
+        ruta = urlsplit(self.path)
+        config = self.estado.config
+        # El cuerpo se lee siempre: la conexión keep-alive se reutiliza
+        cuerpo = self._cuerpo()
+
+        if ruta.path.startswith('/_mock/'):
+            self._control(metodo, ruta.path, cuerpo)
+            return
+
+        retraso = config['latencia_ms'] + random.uniform(0, config['jitter_ms'])
+        if retraso:
+            time.sleep(retraso / 1000)
+
+        if config['caida']:
+            # Sin respuesta: el cliente ve un error de conexión
+            self.close_connection = True
+            self.estado.registrar(_ID_RE.sub('/{id}', ruta.path), 599, time.monotonic() - inicio)
+            return
+
+        clave = self.headers.get('Idempotency-Key')
+        with self.estado.lock:
+            repetida = self.estado.idempotentes.get(clave) if clave else None
+            fallar = config['fallar_siguientes'] > 0
+            if fallar:
+                config['fallar_siguientes'] -= 1
+        if fallar:
+            status = self._responder(503, {'mensajeError': 'SFV no disponible (simulado)'})
+        elif repetida:
+            # Misma clave: se devuelve la respuesta original sin repetir la operación
+            status, contenido, tipo = repetida
+            self._responder(status, contenido=contenido, tipo=tipo)
+        elif random.random() < config['tasa_error']:
+            status = self._responder(500, {'mensajeError': 'Error simulado del SFV'})
+        else:
+            status = self._despachar(metodo, ruta.path, cuerpo)
+            if clave and status < 500:
+                with self.estado.lock:
+                    self.estado.idempotentes[clave] = self._ultima_respuesta
+        self.estado.registrar(_ID_RE.sub('/{id}', ruta.path), status, time.monotonic() - inicio)
+
+    def do_GET(self):
+        self._atender('GET')
+
+    def do_POST(self):
+        self._atender('POST')
+
+    def do_PUT(self):
+        self._atender('PUT')
+
+    def do_DELETE(self):
+        self._atender('DELETE')
+
+    def _control(self, metodo, path, cambios):
+        if path == '/_mock/config':
+            if metodo == 'POST':
+                self.estado.config.update({k: v for k, v in cambios.items() if k in self.estado.config})
+            self._responder(200, self.estado.config)
+        elif path == '/_mock/estadisticas':
+            with self.estado.lock:
+                self._responder(200, self.estado.estadisticas)
+        else:
+            self._responder(404, {'mensajeError': 'Ruta de control desconocida'})
+
+    # --- endpoints del SFV -----------------------------------------------
+
+    def _despachar(self, metodo, path, cuerpo):
+        partes = [p for p in path.split('/') if p]
+
+        if path in PARAMETROS:
+            return self._responder(200, [
+                {'codigoClasificador': codigo, 'descripcion': descripcion}
+                for codigo, descripcion in PARAMETROS[path]
+            ])
+        if path == '/productos':
+            return self._responder(200, [
+                {'codigoProducto': codigo, 'descripcionProducto': descripcion}
+                for codigo, descripcion in PRODUCTOS_SIN
+            ])
+        if path == '/factura/emitir-computarizada':
+            return self._emitir(cuerpo)
+        if path.startswith('/factura/emitir-paquete/'):
+            return self._responder(200, {'codigoEstado': 901, 'mensaje': 'Paquete recibido'})
+        if path == '/factura/anular':
+            self._cambiar_estado(cuerpo.get('cuf'), 905)
+            return self._responder(200, {'codigoEstado': '905', 'mensaje': 'Anulación confirmada'})
+        if path == '/factura/reversion-anular':
+            self._cambiar_estado(cuerpo.get('cuf'), 908)
+            return self._responder(200, {'codigoEstado': '907', 'mensaje': 'Reversión confirmada'})
+        if path == '/factura/estado':
+            return self._estados(cuerpo.get('cufs') or [])
+        if path == '/pdf/download':
+            return self._responder(200, contenido=PDF_MINIMO, tipo='application/pdf')
+        if partes[:2] == ['codigos', 'obtener-cufd']:
+            return self._cufd()
+        if partes[:2] == ['api', 'clientes']:
+            if metodo == 'POST':
+                return self._responder(200, {'id': next(self.estado.ids)})
+            if metodo == 'DELETE':
+                return self._responder(204, contenido=b'')
+            return self._responder(200, {'id': int(partes[2])})
+        if path == '/item/crear-item':
+            return self._responder(200, {'id': next(self.estado.ids)})
+        if partes[:2] == ['item', 'actualizar-item']:
+            return self._responder(200, {'id': int(partes[2])})
+        if path == '/contingencia/verificar-comunicacion':
+            return self._responder(200, {'mensaje': 'Conexion exitosa'})
+        if path == '/contingencia/registrar-inicio-evento':
+            return self._responder(200, {'mensaje': 'Evento registrado', 'idEvento': next(self.estado.ids)})
+        if partes[:2] == ['contingencia', 'registrar-fin-evento']:
+            return self._responder(200, {'mensaje': 'Evento registrado con exito'})
+        return self._responder(404, {'mensajeError': f'Endpoint no simulado: {metodo} {path}'})
+
+    def _emitir(self, payload):
+        sucursal = payload.get('idSucursal') or 1
+        punto_venta = payload.get('idPuntoVenta') or 1
+        # Las facturas de contingencia llegan con número y CUF calculados localmente
+        numero = payload.get('numeroFactura') or self.estado.siguiente_numero(sucursal, punto_venta)
+        cuf = payload.get('cuf') or uuid.uuid4().hex.upper()
+        with self.estado.lock:
+            self.estado.facturas[cuf] = numero
+            self.estado.estados[cuf] = 908
+        return self._responder(200, {
+            'codigoEstado': 908,
+            'cuf': cuf,
+            'numeroFactura': numero,
+            'url': f'http://{self.headers.get("Host")}/consulta?cuf={cuf}',
+        })
+
+    def _cambiar_estado(self, cuf, codigo):
+        with self.estado.lock:
+            if cuf in self.estado.facturas:
+                self.estado.estados[cuf] = codigo
+
+    def _estados(self, cufs):
+        # Las facturas desconocidas no aparecen en la respuesta
+        with self.estado.lock:
+            return self._responder(200, [
+                {'cuf': cuf, 'numeroFactura': self.estado.facturas[cuf], 'codigoEstado': self.estado.estados[cuf]}
+                for cuf in cufs if cuf in self.estado.facturas
+            ])
+
+    def _cufd(self):
+        ahora = datetime.now().replace(microsecond=0)
+        return self._responder(200, {
+            'estado': True,
+            'codigo': uuid.uuid4().hex.upper(),
+            'codigoControl': uuid.uuid4().hex[:15].upper(),
+            'fechaCreacion': ahora.isoformat(),
+            'fechaVigencia': (ahora + timedelta(hours=24)).isoformat(),
+        })
+
+
+def crear_servidor(host='127.0.0.1', port=8899, **config):
+    """Servidor listo para ``serve_forever``; ``port=0`` elige un puerto libre."""
+    manejador = type('ManejadorSFV', (ManejadorSFV,), {'estado': EstadoMock(**config)})
+    servidor = ThreadingHTTPServer((host, port), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def iniciar_en_hilo(**kwargs):
+    """Arranca el servidor en un hilo y devuelve ``(servidor, url)``."""
+    servidor = crear_servidor(**kwargs)
+    threading.Thread(target=servidor.serve_forever, name='mock-sfv', daemon=True).start()
+    host, port = servidor.server_address[:2]
+    return servidor, f'http://{host}:{port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--latencia-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--tasa-error', type=float, default=0.0)
+    parser.add_argument('--caida', action='store_true')
+    args = parser.parse_args()
+
+    servidor = crear_servidor(
+        args.host, args.port,
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        tasa_error=args.tasa_error,
+        caida=args.caida,
+    )
+    print(f"SFV simulado en http://{args.host}:{args.port}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
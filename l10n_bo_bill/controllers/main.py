@@ -0,0 +1,123 @@
+import hmac
+import io
+import logging
+import zipfile
+
+from odoo import http, api
+from odoo.http import request, content_disposition, Response
+from odoo.tools import config
+
+from ..tools import sfv_metrics
+
+_logger = logging.getLogger(__name__)
+
+
+class _ZipStream(io.RawIOBase):
+    """Destino no posicionable para ZipFile: acumula los bytes hasta que se leen."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _generar_zip(registry, uid, exportacion_id):
+    """Escribe el ZIP archivo por archivo; nunca mantiene todos los PDF en memoria.
+
+    Se ejecuta al enviar la respuesta, cuando el cursor de la petición ya
+    está cerrado, por eso abre el suyo.
+    """
+    stream = _ZipStream()
+    with registry.cursor() as cr:
+        env = api.Environment(cr, uid, {})
+        exportacion = env['l10n_bo_bill.exportacion_pdf'].browse(exportacion_id)
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as zf:
+            for lote in exportacion._iterar_pdfs():
+                for nombre, attachment in lote:
+                    zf.writestr(nombre, attachment.raw)
+                    attachment.invalidate_recordset(['raw', 'datas'])
+                    yield stream.pop()
+            if exportacion.errores:
+                zf.writestr('errores.txt', exportacion.errores)
+        yield stream.pop()
+
+
+def _gauges(env):
+    """Estado de la cola, de la contingencia y de la conexión al momento del scrape."""
+    env.cr.execute("""
+        SELECT c.state, COALESCE(s.name, 'default'), count(*),
+               EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - min(c.create_date))
+          FROM l10n_bo_bill_emision_cola c
+     LEFT JOIN selling_point s ON s.id = c.selling_point_id
+         WHERE c.state != 'hecho'
+      GROUP BY c.state, s.name
+    """)
+    cola, antiguedad = [], []
+    for state, punto, cantidad, segundos in env.cr.fetchall():
+        cola.append(({'state': state, 'selling_point': punto}, cantidad))
+        if state == 'pendiente':
+            antiguedad.append(({'selling_point': punto}, round(segundos or 0)))
+
+    selling_point = env['selling_point'].sudo()
+    contingencia = [({'selling_point': 'default'}, int(selling_point._get_lane()['contingencia']))]
+    contingencia += [
+        ({'selling_point': punto.name}, int(punto.contingencia))
+        for punto in selling_point.search([])
+    ]
+
+    config_api = env['l10n_bo_bill.direccion_api'].sudo()._get_config_activa() or {}
+    return [
+        ('sfv_emision_cola', "Filas de la cola de emisión sin emitir.", cola),
+        ('sfv_emision_cola_antiguedad_seconds', "Antigüedad de la fila pendiente más vieja.", antiguedad),
+        ('sfv_contingencia', "1 si el punto de venta está en contingencia.", contingencia),
+        ('sfv_conexion', "1 si la sonda de comunicación con el SFV responde.",
+         [({}, int(config_api.get('estado_conexion', 'ok') == 'ok'))]),
+    ]
+
+
+class FacturacionController(http.Controller):
+
+    @http.route('/l10n_bo_bill/metrics', type='http', auth='none', methods=['GET'], save_session=False)
+    def metrics(self, token=None, **kwargs):
+        """Métricas para Prometheus; solo disponibles si se configura ``sfv_metrics_token``."""
+        esperado = config.get('sfv_metrics_token')
+        if not esperado:
+            return request.not_found()
+        autorizacion = request.httprequest.headers.get('Authorization', '')
+        recibido = token or autorizacion.removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(recibido.encode(), str(esperado).encode()):
+            return Response("Unauthorized", status=401)
+
+        gauges = _gauges(request.env) if request.db else []
+        return Response(
+            sfv_metrics.exponer(gauges),
+            headers=[('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')],
+        )
+
+    @http.route('/l10n_bo_bill/exportacion_pdf/<int:exportacion_id>', type='http', auth='user')
+    def exportacion_pdf(self, exportacion_id, **kwargs):
+        exportacion = request.env['l10n_bo_bill.exportacion_pdf'].browse(exportacion_id).exists()
+        if not exportacion:
+            return request.not_found()
+        exportacion.check_access_rule('read')
+
+        headers = [
+            ('Content-Type', 'application/zip'),
+            ('Content-Disposition', content_disposition('facturas.zip')),
+        ]
+        return Response(
+            _generar_zip(request.env.registry, request.env.uid, exportacion.id),
+            headers=headers,
+            direct_passthrough=True,
+        )
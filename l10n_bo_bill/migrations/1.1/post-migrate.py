@@ -0,0 +1,77 @@
+"""Traslada los datos fiscales de account_move a l10n_bo_bill_factura_fiscal.
+
+Los números y CUF repetidos (facturas duplicadas que copiaron el CUF de la
+original) se conservan solo en la factura más antigua, para que puedan
+crearse los índices únicos; el resto queda registrado en el log.
+"""
+import logging
+
+from odoo.tools.sql import column_exists
+
+_logger = logging.getLogger(__name__)
+
+COLUMNAS_ANTIGUAS = (
+    'l10n_bo_cuf', 'l10n_bo_cufd', 'l10n_bo_invoice_number', 'url',
+    'efact_control_code', 'cafc', 'dui', 'auth_number', 'control_code',
+)
+
+
+def migrate(cr, version):
+    if not column_exists(cr, 'account_move', 'l10n_bo_cuf'):
+        return
+
+    cr.execute("""
+        WITH origen AS (
+            SELECT id, company_id, l10n_bo_branch_office, l10n_bo_selling_point,
+                   NULLIF(l10n_bo_cuf, '') AS cuf,
+                   NULLIF(l10n_bo_cufd, '') AS cufd,
+                   CASE WHEN l10n_bo_invoice_number ~ '^[0-9]{1,9}$' THEN l10n_bo_invoice_number::int END AS numero,
+                   NULLIF(url, '') AS url,
+                   NULLIF(efact_control_code, '') AS efact_control_code,
+                   NULLIF(NULLIF(cafc, ''), '123') AS cafc,
+                   NULLIF(dui, '') AS dui,
+                   NULLIF(auth_number, '') AS auth_number,
+                   NULLIF(control_code, '') AS control_code,
+                   create_uid, create_date, write_uid, write_date
+              FROM account_move
+        ),
+        numerado AS (
+            SELECT *,
+                   row_number() OVER (PARTITION BY cuf ORDER BY id) AS orden_cuf,
+                   row_number() OVER (
+                       PARTITION BY COALESCE(l10n_bo_selling_point, 0), COALESCE(l10n_bo_branch_office, 0),
+                                    company_id, numero
+                       ORDER BY id
+                   ) AS orden_numero
+              FROM origen
+             WHERE COALESCE(cuf, cufd, url, efact_control_code, cafc, dui, auth_number, control_code) IS NOT NULL
+                OR numero IS NOT NULL
+        )
+        INSERT INTO l10n_bo_bill_factura_fiscal (
+            move_id, company_id, branch_office_id, selling_point_id,
+            cuf, cufd, numero_factura, url, efact_control_code, cafc, dui, auth_number, control_code,
+            create_uid, create_date, write_uid, write_date
+        )
+        SELECT id, company_id, l10n_bo_branch_office, l10n_bo_selling_point,
+               CASE WHEN cuf IS NULL OR orden_cuf = 1 THEN cuf END,
+               cufd,
+               CASE WHEN numero IS NULL OR orden_numero = 1 THEN numero END,
+               url, efact_control_code, cafc, dui, auth_number, control_code,
+               create_uid, create_date, write_uid, write_date
+          FROM numerado
+        ON CONFLICT (move_id) DO NOTHING
+    """)
+    _logger.info("Datos fiscales trasladados de %s facturas", cr.rowcount)
+
+    cr.execute("""
+        SELECT m.id, m.l10n_bo_cuf, m.l10n_bo_invoice_number
+          FROM account_move m
+          JOIN l10n_bo_bill_factura_fiscal f ON f.move_id = m.id
+         WHERE (NULLIF(m.l10n_bo_cuf, '') IS NOT NULL AND f.cuf IS NULL)
+            OR (m.l10n_bo_invoice_number ~ '^[0-9]+$' AND f.numero_factura IS NULL)
+    """)
+    for move_id, cuf, numero in cr.fetchall():
+        _logger.warning("Factura %s: CUF %s / número %s repetido o inválido, no se trasladó", move_id, cuf, numero)
+
+    for columna in COLUMNAS_ANTIGUAS:
+        cr.execute(f'ALTER TABLE account_move DROP COLUMN IF EXISTS "{columna}"')
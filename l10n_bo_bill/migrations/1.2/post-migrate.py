@@ -0,0 +1,14 @@
+"""Desactiva la conciliación de estados instalada activa en la 1.1.
+
+El cron depende de /factura/estado, que la API del SFV todavía no
+publica; su registro es noupdate, por eso no lo corrige la actualización.
+"""
+
+
+def migrate(cr, version):
+    cr.execute("""
+        UPDATE ir_cron
+           SET active = false
+         WHERE id IN (SELECT res_id FROM ir_model_data
+                       WHERE module = 'l10n_bo_bill' AND name = 'ir_cron_conciliar_estados')
+    """)
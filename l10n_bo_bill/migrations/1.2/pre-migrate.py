@@ -0,0 +1,18 @@
+"""Renombra sfv_payload_digest a sfv_payload_checksum.
+
+El valor es un sha256 del payload de contingencia que cualquiera con
+acceso a la fila puede recalcular: sirve como control de integridad, no
+como firma.
+"""
+from odoo.tools.sql import column_exists, rename_column
+
+
+def migrate(cr, version):
+    if not column_exists(cr, 'account_move', 'sfv_payload_digest'):
+        return
+    rename_column(cr, 'account_move', 'sfv_payload_digest', 'sfv_payload_checksum')
+    cr.execute("""
+        UPDATE ir_model_fields
+           SET name = 'sfv_payload_checksum'
+         WHERE model = 'account.move' AND name = 'sfv_payload_digest'
+    """)
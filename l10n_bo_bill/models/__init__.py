@@ -1,5 +1,11 @@
+from . import sfv_mixin
 from . import direccion_api
+from . import sucursal
 from . import res_partner
 from . import account_move
+from . import factura_fiscal
 from . import product_template
-from . import cufd
\ No newline at end of file
+from . import cufd
+from . import catalogo
+from . import emision_cola
+from . import exportacion_pdf
\ No newline at end of file
@@ -4,27 +4,181 @@ from odoo.exceptions import ValidationError
 from datetime import datetime
 import json
 import requests
+from ..tools import sfv_client
 import logging
 import base64
+import hashlib
 from datetime import datetime
+from psycopg2.errors import LockNotAvailable
 import pytz
+import re
+import uuid
 from datetime import timedelta
+from odoo.tools import split_every
+import time
+import os
+import tempfile
+from ..tools import cuf as cuf_sin
 
 
 
 _logger = logging.getLogger(__name__)
 
+# Conciliación de estados: facturas por lote confirmado y CUFs por consulta al SFV
+LOTE_CONCILIACION = 1000
+CUFS_POR_CONSULTA = 200
+# Parámetro con la marca (write_date, id) de la última factura conciliada
+PARAM_MARCA_CONCILIACION = 'l10n_bo_bill.conciliacion_marca'
+# write_date es el inicio de la transacción: las más recientes que este margen
+# pueden seguir sin confirmar y se dejan para la próxima ejecución
+MARGEN_CONCILIACION = timedelta(minutes=5)
+
+# Bytes leídos por vez al descargar un PDF del SFV
+TAMANO_BLOQUE_PDF = 64 * 1024
+
+# Lado en píxeles del QR de verificación generado localmente
+QR_TAMANO = 300
+
+# Campo de la factura -> columna de l10n_bo_bill.factura_fiscal
+CAMPOS_FISCALES = {
+    'l10n_bo_cuf': 'cuf',
+    'l10n_bo_cufd': 'cufd',
+    'l10n_bo_invoice_number': 'numero_factura',
+    'url': 'url',
+    'efact_control_code': 'efact_control_code',
+    'cafc': 'cafc',
+    'dui': 'dui',
+    'auth_number': 'auth_number',
+    'control_code': 'control_code',
+}
+
+# Operadores negativos de dominio y su forma positiva
+NEGACIONES = {'!=': '=', 'not in': 'in', 'not like': 'like', 'not ilike': 'ilike'}
+
+# codigoEstado del SFV y campos de la factura que implica
+ESTADOS_SFV = {
+    908: {'is_confirmed': True, 'is_cancelled': False},
+    905: {'is_cancelled': True},
+    902: {'is_confirmed': False},
+}
+
+
+def _emitir_en_api(url, payload, referencia, debug=False, idempotency_key=None):
+    """POST de emisión; no usa el ORM, puede ejecutarse en un hilo del pool.
+
+    ``referencia`` es el id de la factura; ``debug`` vuelca payload y respuesta
+    al log. Con ``idempotency_key`` los fallos transitorios se reintentan sin
+    riesgo de emitir la factura dos veces.
+    """
+    try:
+        response = sfv_client.post(url, json=payload, ref=referencia, debug=debug, idempotency_key=idempotency_key)
+        # Solo los errores de servidor o de red cuentan como caída del SFV
+        if response.status_code >= 500:
+            sfv_client.circuit_breaker.registrar_fallo()
+        else:
+            sfv_client.circuit_breaker.registrar_exito()
+        response.raise_for_status()
+        data = response.json()
+
+        if not all(k in data for k in ('codigoEstado', 'cuf', 'numeroFactura', 'url')):
+            raise UserError("La respuesta de la API no contiene todos los campos necesarios.")
+        return data
+
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code if e.response is not None else "Sin código"
+        try:
+            error_data = e.response.json()
+            error_msg = json.dumps(error_data, indent=2, ensure_ascii=False)
+        except Exception:
+            error_msg = e.response.text if e.response is not None else "Sin respuesta detallada de la API"
+
+        _logger.error(f"Error HTTP al emitir factura {referencia}: {status} - {error_msg}")
+        raise UserError(f"Error HTTP {status}:\n{error_msg}")
+
+    except requests.exceptions.RequestException as e:
+        sfv_client.circuit_breaker.registrar_fallo()
+        _logger.error(f"Error de conexión al emitir factura {referencia}: {e}")
+        raise UserError(f"No se pudo emitir la factura: {e}")
+
+
+def _descargar_pdf_url(full_url, directorio):
+    """Descarga la representación gráfica a disco; no usa el ORM, puede ejecutarse en un hilo del pool.
+
+    El cuerpo se escribe por bloques en un temporal dentro de ``directorio``
+    mientras se calcula su sha1, sin tenerlo entero en memoria. Devuelve
+    ``(ruta_temporal, checksum, tamaño)``.
+    """
+    _logger.info("URL completa para la descarga del PDF: %s", full_url)
+    try:
+        response = sfv_client.get(full_url, stream=True)
+    except requests.exceptions.RequestException as e:
+        raise UserError("Error al conectar con la API: %s" % e)
+
+    with response:
+        if response.status_code != 200:
+            _logger.error("Error al descargar el PDF. Código de estado: %s. Respuesta: %s", response.status_code, response.text)
+            raise UserError("Error al descargar el PDF. Código de estado: %s" % response.status_code)
+
+        sha = hashlib.sha1()
+        tamano = 0
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(prefix='sfv-pdf-', suffix='.tmp', dir=directorio)
+        try:
+            with os.fdopen(descriptor, 'wb') as archivo:
+                for bloque in response.iter_content(TAMANO_BLOQUE_PDF):
+                    sha.update(bloque)
+                    tamano += len(bloque)
+                    archivo.write(bloque)
+        except (OSError, requests.exceptions.RequestException) as e:
+            os.unlink(temporal)
+            raise UserError("Error al descargar el PDF: %s" % e)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+    return temporal, sha.hexdigest(), tamano
+
+
+def _anular_en_api(url, payload, referencia, idempotency_key):
+    """POST de anulación; no usa el ORM, puede ejecutarse en un hilo del pool."""
+    try:
+        response = sfv_client.post(url, json=payload, ref=referencia, idempotency_key=idempotency_key)
+        if response.status_code >= 500:
+            sfv_client.circuit_breaker.registrar_fallo()
+        else:
+            sfv_client.circuit_breaker.registrar_exito()
+        response.raise_for_status()
+        data = response.json()
+    except requests.exceptions.RequestException as e:
+        raise UserError(f"Error al anular la factura en la API: {e}")
+
+    if data.get('codigoEstado') != "905":
+        raise UserError(f"No se confirmó la anulación en la API. Estado: {data.get('codigoEstado')}")
+    return data
+
+
+def _consultar_estados_api(url, cufs):
+    """Estado de varias facturas en una llamada; no usa el ORM, puede ejecutarse en un hilo del pool."""
+    response = sfv_client.post(url, json={"cufs": cufs})
+    response.raise_for_status()
+    datos = response.json()
+    if not isinstance(datos, list):
+        raise UserError("La API no devolvió una lista de estados.")
+    return datos
+
+
 class AccountMove(models.Model):
-    _inherit = 'account.move'
+    _inherit = ['account.move', 'l10n_bo_bill.sfv_mixin']
 
-    l10n_bo_cufd = fields.Text(string='CUFD Code')
-    l10n_bo_selling_point = fields.Many2one('selling_point', string='Selling Point', readonly=True)
-    l10n_bo_branch_office = fields.Many2one('branch_office', string='Branch Office', readonly=True)
+    l10n_bo_cufd = fields.Char(string='CUFD Code', compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales')
+    l10n_bo_selling_point = fields.Many2one('selling_point', string='Selling Point', index=True)
+    l10n_bo_branch_office = fields.Many2one(
+        'branch_office', string='Branch Office', related='l10n_bo_selling_point.branch_office_id', store=True
+    )
     l10n_bo_emission_type = fields.Many2one('emission_types', string='Emission Type')
-    qr_code = fields.Binary(string="QR Code", attachment=True, store=True)
+    qr_code = fields.Binary(string="QR Code", attachment=True, store=True, copy=False)
     l10n_bo_document_status = fields.Many2one('document_status', string='Document Status')
 
-    cafc = fields.Text(string='cafc', default='123')
+    cafc = fields.Char(string='cafc', compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales')
 
     e_billing = fields.Boolean(string='Electronic Billing', default=False)
     representation_format = fields.Boolean('Graphic Representation Format', default=False)
@@ -49,9 +203,9 @@ class AccountMove(models.Model):
     invoice_caption = fields.Char(string='Invoice Caption')
     is_offline = fields.Boolean('Is Offline', default=False)
 
-    dui = fields.Text('DUI')
-    auth_number = fields.Text('Authorization Number')
-    control_code = fields.Text('Control Code')
+    dui = fields.Char('DUI', compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales')
+    auth_number = fields.Char('Authorization Number', compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales')
+    control_code = fields.Char('Control Code', compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales')
 
     dosage_id = fields.Many2one('invoice_dosage', string='Dosage')
     reversed_inv_id = fields.Many2one('cancelled_invoices', string='Reversed Invoice')
@@ -68,124 +222,454 @@ class AccountMove(models.Model):
     
     
     ##--------------------------Para Usar--------------------------##
-    l10n_bo_cuf = fields.Text(string='CUF Code')
-    l10n_bo_invoice_number = fields.Text(string='Invoice Number', readonly=True)
-    efact_control_code = fields.Text(string='Url', readonly=True)
+    # Datos fiscales guardados en l10n_bo_bill.factura_fiscal, con índices por CUF y por número
+    sfv_fiscal_ids = fields.One2many('l10n_bo_bill.factura_fiscal', 'move_id', string='Datos Fiscales SFV')
+    l10n_bo_cuf = fields.Char(string='CUF Code', compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales', search='_search_l10n_bo_cuf')
+    l10n_bo_invoice_number = fields.Char(
+        string='Invoice Number', readonly=True, compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales', search='_search_l10n_bo_invoice_number'
+    )
+    efact_control_code = fields.Char(string='Url', readonly=True, compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales')
     
     valid_nit = fields.Boolean(string='Valid NIT', default=True)
     montoGiftCard = fields.Text(string='montoGiftCard', default='')
     is_reverted = fields.Boolean('Is Reverted', default=False)
     payment_method_code = fields.Selection(selection='_get_payment_methods', string="Método de Pago", help="Selecciona el método de pago desde la API")
-    url = fields.Text(string="URL")
+    url = fields.Char(string="URL", compute='_compute_datos_fiscales', inverse='_inverse_datos_fiscales')
     
     mostrar_boton_fin_contingencia = fields.Boolean(
         compute='_compute_mostrar_boton_fin_contingencia', store=False
     )
+
+    sfv_payload_contingencia = fields.Text(string='Payload de Contingencia', readonly=True, copy=False)
+    # Detecta cambios accidentales del payload guardado; no es una firma
+    sfv_payload_checksum = fields.Char(string='Checksum del Payload', readonly=True, copy=False)
+    sfv_contingencia_enviada = fields.Boolean(string='Enviada en Paquete', readonly=True, copy=False)
+
+    sfv_idempotency_key = fields.Char(string='Clave de Idempotencia SFV', readonly=True, copy=False)
+
+    sfv_pdf_attachment_id = fields.Many2one('ir.attachment', string='PDF SFV', readonly=True, copy=False)
+    sfv_pdf_clave = fields.Char(string='Clave del PDF SFV', readonly=True, copy=False)
+
+    sfv_cola_ids = fields.One2many('l10n_bo_bill.emision_cola', 'move_id', string='Cola de Emisión', readonly=True)
+    sfv_cola_estado = fields.Selection(
+        [('pendiente', 'Pendiente'), ('hecho', 'Emitida'), ('error', 'Error')],
+        string='Estado en Cola', compute='_compute_sfv_cola'
+    )
+    sfv_cola_intentos = fields.Integer(string='Intentos de Emisión', compute='_compute_sfv_cola')
+    sfv_cola_error = fields.Text(string='Último Error de Emisión', compute='_compute_sfv_cola')
     
     
     def _compute_mostrar_boton_fin_contingencia(self):
-        direccion_api = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
         for rec in self:
-            rec.mostrar_boton_fin_contingencia = direccion_api.contingencia if direccion_api else False
+            rec.mostrar_boton_fin_contingencia = rec._sfv_lane()['contingencia']
 
-    
-    def _get_api_url(self):
-        direccion_apis = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
+    def _sfv_lane(self):
+        """Sucursal, punto de venta y contingencia con que se emite la factura."""
+        self.ensure_one()
+        return self.env['selling_point']._get_lane(self.l10n_bo_selling_point.id)
 
-        if not direccion_apis:
-            raise UserError("No se encontró una configuración de la API activa.")
-        
-        if len(direccion_apis) > 1:
-            raise UserError("Hay más de una dirección de API activa. Por favor, verifica la configuración.")
+    @api.depends('sfv_cola_ids.state', 'sfv_cola_ids.intentos', 'sfv_cola_ids.ultimo_error')
+    def _compute_sfv_cola(self):
+        for rec in self:
+            # La cola se ordena por id descendente: la primera fila es la última
+            fila = rec.sfv_cola_ids[:1]
+            rec.sfv_cola_estado = fila.state
+            rec.sfv_cola_intentos = fila.intentos
+            rec.sfv_cola_error = fila.ultimo_error
+
+    @api.depends(*(f'sfv_fiscal_ids.{columna}' for columna in CAMPOS_FISCALES.values()))
+    def _compute_datos_fiscales(self):
+        for move in self:
+            fiscal = move.sfv_fiscal_ids[:1]
+            for campo, columna in CAMPOS_FISCALES.items():
+                valor = fiscal[columna] if fiscal else False
+                if columna == 'numero_factura':
+                    valor = str(valor) if valor else False
+                move[campo] = valor
+
+    def _inverse_datos_fiscales(self):
+        for move in self:
+            vals = {columna: move[campo] or False for campo, columna in CAMPOS_FISCALES.items()}
+            if vals['numero_factura']:
+                if not str(vals['numero_factura']).isdigit():
+                    raise ValidationError("El número de factura debe ser numérico.")
+                vals['numero_factura'] = int(vals['numero_factura'])
+            fiscal = move.sfv_fiscal_ids[:1]
+            if fiscal:
+                fiscal.write(vals)
+            elif any(vals.values()):
+                self.env['l10n_bo_bill.factura_fiscal'].create(dict(
+                    vals,
+                    move_id=move.id,
+                    company_id=move.company_id.id,
+                    branch_office_id=move.l10n_bo_branch_office.id,
+                    selling_point_id=move.l10n_bo_selling_point.id,
+                ))
 
-        return direccion_apis.url
+    @api.model
+    def _campos_fiscales(self, columnas):
+        """Campos de la factura que muestran las columnas fiscales indicadas."""
+        return [campo for campo, columna in CAMPOS_FISCALES.items() if columna in columnas]
+
+    def _dominio_fiscal(self, columna, operator, value):
+        # Los operadores de texto (like, ilike y sus negaciones) se aplican a
+        # la columna de la tabla fiscal; las facturas sin fila cuentan como vacías
+        if operator in ('=', '!=') and not value:
+            vacio = 'not any' if operator == '=' else 'any'
+            return [('sfv_fiscal_ids', vacio, [(columna, '!=', False)])]
+        if operator in NEGACIONES:
+            return [('sfv_fiscal_ids', 'not any', [(columna, NEGACIONES[operator], value)])]
+        return [('sfv_fiscal_ids', 'any', [(columna, operator, value)])]
+
+    def _search_l10n_bo_cuf(self, operator, value):
+        return self._dominio_fiscal('cuf', operator, value)
+
+    def _search_l10n_bo_invoice_number(self, operator, value):
+        # La columna es entera: un valor que no es número no coincide con ninguna factura
+        if operator in ('in', 'not in'):
+            valores = value if isinstance(value, (list, tuple, set)) else [value]
+            value = [int(v) for v in valores if str(v).isdigit()]
+        elif operator in ('=', '!=', '<', '<=', '>', '>=') and value:
+            if not str(value).isdigit():
+                return [] if operator == '!=' else [('id', '=', False)]
+            value = int(value)
+        return self._dominio_fiscal('numero_factura', operator, value)
 
     
+    def _sfv_idempotency_key(self, operacion):
+        """Clave de idempotencia de una operación (emitir, anular, revertir) sobre la factura.
+
+        Sin clave guardada se deriva una determinística del id, igual en
+        todos los reintentos y workers.
+        """
+        self.ensure_one()
+        base = self.sfv_idempotency_key
+        if not base:
+            dbuuid = self.env['ir.config_parameter'].sudo().get_param('database.uuid')
+            base = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{dbuuid}/account.move/{self.id}"))
+        return f"{base}-{operacion}"
+
+    def _renovar_idempotency_key(self):
+        """Nueva clave: la siguiente emisión o anulación es otro documento para el SFV."""
+        for move in self:
+            move.sfv_idempotency_key = str(uuid.uuid4())
+
+    def button_draft(self):
+        # Al volver a emitir se genera una nueva entrada en el SIN
+        self.filtered(lambda m: m.l10n_bo_cuf)._renovar_idempotency_key()
+        return super().button_draft()
+
     @api.model
     def _get_payment_methods(self):
         #Metodos de Pago
-        api_url = self._get_api_url()
-        url = f"{api_url}/parametro/metodo-pago"
-
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            metodos = response.json()
-
-            if not isinstance(metodos, list):
-                raise UserError("La API no devolvió una lista válida de métodos de pago.")
-
-            return [
-                (str(m.get("codigoClasificador")), f"{m.get('codigoClasificador')} - {m.get('descripcion', 'Sin descripción')}")
-                for m in metodos if m.get("codigoClasificador")
-            ]
-
-        except requests.exceptions.RequestException as e:
-            _logger.error(f"Error al obtener métodos de pago de la API: {e}")
-            return []
+        return self.env['l10n_bo_bill.catalogo']._get_selection('metodo_pago')
 
     def envio_sfv(self):
         #Facturacion y verificacion de conexion
         _logger.info("Iniciando proceso de envío SFV para las siguientes facturas: %s", self.ids)
-        direccion_api = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
-        if direccion_api:
-            _logger.info("Dirección API: %s | Contingencia: %s", direccion_api.url, direccion_api.contingencia)
+        config = self._get_config_api()
+        if config:
+            _logger.info("Dirección API: %s | Contingencia: %s", config['url'], config['contingencia'])
         else:
             _logger.warning("No hay API")
 
-        # If Contingencia Activa
-        if direccion_api and direccion_api.contingencia:
+        # Todas en puntos de venta con contingencia activa; en una selección
+        # mixta _emitir_lote separa las que se emiten localmente
+        en_contingencia = self.filtered(lambda f: f._sfv_lane()['contingencia'])
+        if en_contingencia and en_contingencia == self:
             _logger.info("----Contingencia activa----")
+            return self._enviar_contingencia()
+
+        # Estado mantenido por la sonda y el circuito: no hay llamada previa a la API
+        if self._sfv_sin_conexion():
+            if config and config['emision_asincrona']:
+                _logger.info("----Sin Conexion - Encolando----")
+                return self._enviar_facturas()
+            if len(self) > 1:
+                # El wizard de contingencia es por factura; en lote se informa cada una
+                _logger.info("----Sin Conexion - Lote----")
+                error = "Sin conexión con el SFV; active la contingencia en el punto de venta o reintente más tarde."
+                return self._accion_reporte_emision({factura.id: error for factura in self})
+            _logger.info("----Sin Conexion - Wizard----")
+            return self.action_mostrar_wizard_contingencia()
+
+        return self._enviar_facturas()
+
+    @api.model
+    def _sfv_sin_conexion(self):
+        """Sin conexión según la sonda en segundo plano o el circuito de este worker."""
+        config = self._get_config_api()
+        if config and config['estado_conexion'] == 'caida':
+            return True
+        return not sfv_client.circuit_breaker.permitir()
+
+    def _enviar_facturas(self):
+        config = self._get_config_api() or {}
+        if config.get('emision_asincrona'):
+            return self._encolar_emision()
+        # Una factura: errores inmediatos; varias: emisión en lote con reporte
+        if len(self) <= 1:
             self.action_envio_a_impuestos()
             return
+        resultados = self._emitir_lote()
+        return self._accion_reporte_emision(resultados)
+
+    def _enviar_contingencia(self):
+        resultados = self._emitir_contingencia_local()
+        if len(self) <= 1:
+            error = resultados.get(self.id)
+            if error:
+                raise UserError(error)
+            return
+        return self._accion_reporte_emision(resultados)
 
-        # Verificación normal si no hay contingencia
-        _logger.info("----Verificando comunicación----")
-        res = self.verificar_comunicacion()
-        if res:
-            _logger.info("----Sin Conexion - Wizard----")
-            return res
-
-        _logger.info("----Comunicación verificada----")
-        self.action_envio_a_impuestos()
+    def _emitir_contingencia_local(self):
+        """Emite las facturas dentro de Odoo mientras dura la contingencia.
 
+        El CUF se calcula con el CUFD vigente y el número sale de una
+        secuencia sin huecos; el payload queda guardado para enviarlo en el
+        paquete al finalizar el evento. Devuelve ``{move_id: error}``.
+        """
+        config = self._get_config_api()
+        modalidad = cuf_sin.MODALIDAD_ELECTRONICA if config['tipo'] == 'electronica' else cuf_sin.MODALIDAD_COMPUTARIZADA
+        zona = pytz.timezone('America/La_Paz')
+        payloads, errores_payload = self._preparar_payloads_emision(config)
 
-    def action_envio_a_impuestos(self):
+        resultados = {}
         for factura in self:
-            _logger.info(f"Datos de factura ID: {factura.id} - Número: {factura.name}")
-
-            if factura.move_type != 'out_invoice':
-                raise UserError("Solo se pueden emitir facturas de cliente.")
-
-            partner = factura.partner_id
-            if not partner.codigo_cliente or not partner.external_id:
-                raise UserError("El cliente no tiene external id.")
-
-            detalle = []
-            for line in factura.invoice_line_ids:
-                product = line.product_id
-                if not product.external_id:
-                    raise UserError(f"El producto '{product.name}' no tiene external id")
-
-                detalle.append({
-                    "idProducto": product.external_id,
-                    "cantidad": str(line.quantity),
-                    "montoDescuento": "0.0",
-                    "precio": str(line.price_unit)
-                })
+            try:
+                # Si algo falla se revierte también el número: la secuencia no deja huecos
+                with self.env.cr.savepoint():
+                    nit = re.sub(r'\D', '', factura.company_id.vat or '')
+                    if not nit:
+                        raise UserError("La compañía no tiene NIT configurado.")
+
+                    lane = factura._sfv_lane()
+                    cufd = self.env['l10n_bo_bill.cufd']._get_cufd_vigente(lane['id_sucursal'], lane['id_punto_venta'])
+                    if not cufd or not cufd['codigo_control']:
+                        raise UserError("No hay un CUFD vigente para emitir en contingencia.")
+
+                    if factura.id in errores_payload:
+                        raise UserError(errores_payload[factura.id])
+                    payload = payloads[factura.id]
+                    # Cada punto de venta numera con su propia secuencia
+                    secuencia = self.env['ir.sequence'].sudo().browse(lane['secuencia_id'])
+                    numero = int(secuencia.next_by_id())
+                    ahora = datetime.now(zona)
+                    milisegundos = f"{ahora.microsecond // 1000:03d}"
+                    cuf = cuf_sin.generar_cuf(
+                        cufd['codigo_control'],
+                        nit=nit,
+                        fecha_hora=ahora.strftime('%Y%m%d%H%M%S') + milisegundos,
+                        sucursal=lane['codigo_sucursal'],
+                        modalidad=modalidad,
+                        tipo_emision=cuf_sin.TIPO_EMISION_FUERA_DE_LINEA,
+                        tipo_factura=cuf_sin.TIPO_FACTURA_CREDITO_FISCAL,
+                        tipo_documento_sector=cuf_sin.DOCUMENTO_SECTOR_COMPRA_VENTA,
+                        numero_factura=numero,
+                        punto_venta=lane['codigo_punto_venta'],
+                    )
+                    payload.update({
+                        "numeroFactura": numero,
+                        "fechaHoraEmision": ahora.strftime('%Y-%m-%dT%H:%M:%S.') + milisegundos,
+                        "cuf": cuf,
+                        "cufd": cufd['codigo'],
+                    })
+                    contenido = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+
+                    self.env['l10n_bo_bill.factura_fiscal']._guardar(
+                        ('cuf', 'numero_factura', 'cufd'), [(factura.id, cuf, numero, cufd['codigo'])]
+                    )
+                    self.env.cr.execute("""
+                        UPDATE account_move
+                        SET is_offline = true,
+                            sfv_payload_contingencia = %s,
+                            sfv_payload_checksum = %s,
+                            sfv_contingencia_enviada = false
+                        WHERE id = %s;
+                    """, (contenido, hashlib.sha256(contenido.encode()).hexdigest(), factura.id))
+                    factura.invalidate_recordset()
+                    factura.action_post()
+                resultados[factura.id] = None
+                _logger.info("Factura %s emitida en contingencia con número %s", factura.name, numero)
+            except (UserError, ValidationError, ValueError) as e:
+                resultados[factura.id] = str(e)
+            except LockNotAvailable:
+                # La secuencia sin huecos está tomada por otra emisión del mismo punto de venta
+                resultados[factura.id] = "Otra emisión en contingencia está usando la numeración del punto de venta; reintente."
+                factura.invalidate_recordset()
+        return resultados
 
-            direccion_api = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
+    @api.model
+    def _sincronizar_secuencia_contingencia(self, selling_point_id=False):
+        """Alinea la secuencia local del punto de venta con su último número emitido por el SFV."""
+        self.env['l10n_bo_bill.factura_fiscal'].flush_model(['selling_point_id', 'numero_factura'])
+        self.env.cr.execute("""
+            SELECT max(numero_factura)
+              FROM l10n_bo_bill_factura_fiscal
+             WHERE COALESCE(selling_point_id, 0) = %s
+        """, (selling_point_id or 0,))
+        ultimo = self.env.cr.fetchone()[0] or 0
+        lane = self.env['selling_point']._get_lane(selling_point_id)
+        secuencia = self.env['ir.sequence'].sudo().browse(lane['secuencia_id'])
+        if secuencia.number_next_actual <= ultimo:
+            secuencia.write({'number_next': ultimo + 1})
 
-            payload = {
-                "usuario": partner.codigo_cliente,
-                "idPuntoVenta": 1,
-                "idCliente": partner.external_id,
+    @api.model
+    def _enviar_paquete_contingencia(self, selling_point_id=False):
+        """Registra en el SFV las facturas del punto de venta emitidas localmente durante la contingencia.
+
+        Devuelve la lista de errores; las facturas enviadas quedan marcadas
+        aunque otras fallen, para no reenviarlas.
+        """
+        url = f"{self._get_api_url()}/factura/emitir-computarizada"
+        config = self._get_config_api()
+        max_hilos = config['max_hilos_emision']
+        facturas = self.search([
+            ('is_offline', '=', True),
+            ('sfv_contingencia_enviada', '=', False),
+            ('sfv_payload_contingencia', '!=', False),
+            ('l10n_bo_selling_point', '=', selling_point_id),
+        ])
+
+        errores = []
+        items = []
+        for factura in facturas:
+            contenido = factura.sfv_payload_contingencia
+            if hashlib.sha256(contenido.encode()).hexdigest() != factura.sfv_payload_checksum:
+                errores.append(f"{factura.name}: el payload guardado fue modificado.")
+                continue
+            items.append((factura, factura.id, json.loads(contenido), factura._sfv_idempotency_key('emitir')))
+
+        debug = config.get('debug')
+        enviadas = []
+        for (factura, _move_id, _payload, _clave), data, error in sfv_client.map_concurrent(
+            lambda item: _emitir_en_api(url, item[2], item[1], debug, item[3]), items, max_hilos
+        ):
+            if error:
+                errores.append(f"{factura.name}: {error}")
+            else:
+                enviadas.append((factura.id, data['url']))
+
+        if enviadas:
+            self.env.cr.execute("""
+                UPDATE account_move SET sfv_contingencia_enviada = true WHERE id = ANY(%s)
+            """, ([e[0] for e in enviadas],))
+            facturas.invalidate_recordset(['sfv_contingencia_enviada'])
+            self.env['l10n_bo_bill.factura_fiscal']._guardar(('url',), enviadas)
+            self.browse([e[0] for e in enviadas])._generar_qr()
+        _logger.info(f"Paquete de contingencia: {len(enviadas)} facturas registradas, {len(errores)} con error")
+        return errores
+
+    def _encolar_emision(self):
+        """Valida las facturas y las deja en la cola; el cron realiza la emisión."""
+        config = self._get_config_api()
+        pendientes = self.filtered(lambda f: not f.l10n_bo_cuf)
+        _payloads, errores = pendientes._preparar_payloads_emision(config)
+        if errores and len(self) == 1:
+            raise UserError(errores[self.id])
+        validas = pendientes.filtered(lambda f: f.id not in errores)
+
+        self.env['l10n_bo_bill.emision_cola']._encolar(validas)
+        mensaje = f"Facturas en cola de emisión: {len(validas)}."
+        if errores:
+            nombres = {m.id: m.name for m in self.browse(list(errores))}
+            detalle = "\n".join(f"- {nombres[move_id]}: {error}" for move_id, error in errores.items())
+            mensaje = f"{mensaje} Con error: {len(errores)}.\n{detalle}"
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': "Envío a impuestos",
+                'message': mensaje,
+                'type': 'warning' if errores else 'info',
+                'sticky': bool(errores),
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            },
+        }
+
+    def _preparar_payload_emision(self, config):
+        """Valida la factura y arma el cuerpo para /factura/emitir-computarizada."""
+        self.ensure_one()
+        payloads, errores = self._preparar_payloads_emision(config)
+        if errores:
+            raise UserError(errores[self.id])
+        return payloads[self.id]
+
+    def _preparar_payloads_emision(self, config):
+        """Valida todas las facturas y arma sus cuerpos de emisión de una vez.
+
+        Líneas, productos y clientes se leen con una consulta por modelo en
+        lugar de recorrer cada factura por el ORM. Devuelve
+        ``({move_id: payload}, {move_id: error})``; las facturas con error no
+        tienen payload.
+        """
+        facturas = self.read(['move_type', 'state', 'partner_id', 'payment_method_code', 'l10n_bo_selling_point'], load=None)
+        emitidas = {
+            fila['move_id'] for fila in self.env['l10n_bo_bill.factura_fiscal'].search_read(
+                [('move_id', 'in', self.ids), ('cuf', '!=', False)], ['move_id'], load=None,
+            )
+        }
+        lineas = self.env['account.move.line'].search_read(
+            [('move_id', 'in', self.ids), ('display_type', '=', 'product')],
+            ['move_id', 'product_id', 'quantity', 'price_unit'],
+            order='move_id, sequence, id',
+            load=None,
+        )
+        productos = {
+            p['id']: p for p in self.env['product.product'].browse(
+                {linea['product_id'] for linea in lineas if linea['product_id']}
+            ).read(['external_id', 'name'], load=None)
+        }
+        clientes = {
+            c['id']: c for c in self.env['res.partner'].browse(
+                {factura['partner_id'] for factura in facturas if factura['partner_id']}
+            ).read(['codigo_cliente', 'external_id'], load=None)
+        }
+
+        detalles = {}
+        errores = {}
+        for linea in lineas:
+            producto = productos.get(linea['product_id'], {})
+            if not producto.get('external_id'):
+                errores.setdefault(linea['move_id'], f"El producto '{producto.get('name') or ''}' no tiene external id")
+                continue
+            detalles.setdefault(linea['move_id'], []).append({
+                "idProducto": producto['external_id'],
+                "cantidad": str(linea['quantity']),
+                "montoDescuento": "0.0",
+                "precio": str(linea['price_unit'])
+            })
+
+        payloads = {}
+        for factura in facturas:
+            if factura['move_type'] != 'out_invoice':
+                errores[factura['id']] = "Solo se pueden emitir facturas de cliente."
+                continue
+            if factura['id'] in emitidas:
+                errores[factura['id']] = "La factura ya fue emitida y tiene CUF."
+                continue
+            if factura['state'] != 'draft':
+                errores[factura['id']] = "Solo se pueden emitir facturas en borrador."
+                continue
+            cliente = clientes.get(factura['partner_id'], {})
+            if not cliente.get('codigo_cliente') or not cliente.get('external_id'):
+                errores[factura['id']] = "El cliente no tiene external id."
+                continue
+            if factura['id'] in errores:
+                continue
+
+            lane = self.env['selling_point']._get_lane(factura['l10n_bo_selling_point'])
+            payloads[factura['id']] = {
+                "usuario": cliente['codigo_cliente'],
+                "idPuntoVenta": lane['id_punto_venta'],
+                "idCliente": cliente['external_id'],
                 "nitInvalido": True,
-                "codigoMetodoPago": int(factura.payment_method_code) if factura.payment_method_code else 1,
-                "activo": not direccion_api.contingencia if direccion_api else True,
+                "codigoMetodoPago": int(factura['payment_method_code']) if factura['payment_method_code'] else 1,
+                "activo": not lane['contingencia'],
                 "masivo": False,
-                "detalle": detalle,
-                "idSucursal": 1,
+                "detalle": detalles.get(factura['id'], []),
+                "idSucursal": lane['id_sucursal'],
                 "numeroFactura": None,
                 "fechaHoraEmision": None,
                 "cafc": False,
@@ -193,57 +677,179 @@ class AccountMove(models.Model):
                 "descuentoGlobal": None,
                 "monGiftCard": None
             }
+        return payloads, errores
 
-            api_url = self._get_api_url()
-            url = f"{api_url}/factura/emitir-computarizada"
+    def _registrar_emision(self, data, cufd=None):
+        """Guarda CUF, número, URL y CUFD usado, y publica la factura."""
+        self.ensure_one()
+        self._guardar_emisiones([(self.id, data, cufd['codigo'] if cufd else None)])
+        _logger.info("Factura %s emitida correctamente con número %s", self.name, data['numeroFactura'])
+        self.action_post()
 
-            _logger.info(f"URL de emisión: {url}")
-            _logger.info(f"JSON enviado: {json.dumps(payload, indent=2)}")
+    @api.model
+    def _guardar_emisiones(self, emisiones):
+        """Guarda en una sola consulta lo devuelto por la API para varias facturas.
+
+        ``emisiones`` es una lista ``[(move_id, data, codigo_cufd)]``.
+        """
+        self.env['l10n_bo_bill.factura_fiscal']._guardar(('cuf', 'numero_factura', 'url', 'cufd'), [
+            (move_id, data['cuf'], int(data['numeroFactura']), data['url'], codigo_cufd)
+            for move_id, data, codigo_cufd in emisiones
+        ])
+        self.browse([e[0] for e in emisiones])._generar_qr()
+
+    def _generar_qr(self):
+        """Genera localmente el QR de verificación a partir de la URL guardada."""
+        reporte = self.env['ir.actions.report']
+        for factura in self.filtered('url'):
+            png = reporte.barcode('QR', factura.url, width=QR_TAMANO, height=QR_TAMANO)
+            factura.qr_code = base64.b64encode(png)
 
+    @api.model
+    def _cron_generar_qr_historico(self, tamano_lote=500, tiempo_maximo=240):
+        """Genera por lotes el QR de las facturas emitidas que aún no lo tienen."""
+        inicio = time.monotonic()
+        while time.monotonic() - inicio < tiempo_maximo:
+            self.env.cr.execute("""
+                SELECT f.move_id
+                  FROM l10n_bo_bill_factura_fiscal f
+                 WHERE f.url IS NOT NULL
+                   AND NOT EXISTS (
+                        SELECT 1 FROM ir_attachment a
+                         WHERE a.res_model = 'account.move'
+                           AND a.res_field = 'qr_code'
+                           AND a.res_id = f.move_id
+                   )
+              ORDER BY f.move_id
+                 LIMIT %s
+            """, (tamano_lote,))
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                break
+            self.browse(ids)._generar_qr()
+            self.env.cr.commit()
+            _logger.info("QR generados para %s facturas", len(ids))
+
+    def _publicar_emitidas(self):
+        """Publica las facturas con un solo ``action_post``; si falla, una por una.
+
+        Devuelve ``{move_id: error}`` de las facturas que no se pudieron publicar.
+        """
+        try:
+            with self.env.cr.savepoint():
+                self.action_post()
+            return {}
+        except (UserError, ValidationError) as e:
+            if len(self) == 1:
+                return {self.id: str(e)}
+            _logger.warning("Publicación en lote fallida (%s); se publica factura por factura", e)
+            self.env.invalidate_all()
+
+        errores = {}
+        for factura in self:
             try:
-                response = requests.post(url, json=payload, timeout=15)
-                response.raise_for_status()
-                data = response.json()
+                with self.env.cr.savepoint():
+                    factura.action_post()
+            except (UserError, ValidationError) as e:
+                errores[factura.id] = str(e)
+                self.env.invalidate_all()
+        return errores
 
-                _logger.info(f"Respuesta API: {json.dumps(data, indent=2)}")
-
-                if not all(k in data for k in ('codigoEstado', 'cuf', 'numeroFactura', 'url')):
-                    raise UserError("La respuesta de la API no contiene todos los campos necesarios.")
-
-                query = """
-                    UPDATE account_move
-                    SET l10n_bo_cuf = %s,
-                        l10n_bo_invoice_number = %s,
-                        url = %s
-                    WHERE id = %s;
-                """
-                self.env.cr.execute(query, (
-                    data['cuf'],
-                    str(data['numeroFactura']),
-                    data['url'],
-                    factura.id
-                ))
-
-                _logger.info(f"Factura {factura.name} emitida correctamente con número {data['numeroFactura']}")
-                factura.action_post()
-
-            except requests.exceptions.HTTPError as e:
-                status = e.response.status_code if e.response else "Sin código"
-                try:
-                    error_data = e.response.json()
-                    error_msg = json.dumps(error_data, indent=2, ensure_ascii=False)
-                except Exception:
-                    error_msg = e.response.text if e.response else "Sin respuesta detallada de la API"
+    def action_envio_a_impuestos(self):
+        config = self._get_config_api()
+        api_url = self._get_api_url()
+        url = f"{api_url}/factura/emitir-computarizada"
 
-                _logger.error(f"Error HTTP al emitir factura {factura.name}: {status} - {error_msg}")
-                raise UserError(f"Error HTTP {status}:\n{error_msg}")
+        # Se valida todo antes de la primera llamada: un error no deja el lote a medias
+        payloads, errores = self._preparar_payloads_emision(config)
+        if errores:
+            raise UserError(next(iter(errores.values())))
 
-            except requests.exceptions.RequestException as e:
-                _logger.error(f"Error de conexión al emitir factura {factura.name}: {e}")
-                raise UserError(f"No se pudo emitir la factura: {e}")
+        for factura in self:
+            payload = payloads[factura.id]
+            data = _emitir_en_api(url, payload, factura.id, config['debug'], factura._sfv_idempotency_key('emitir'))
+            factura._registrar_emision(data, factura._cufd_vigente())
 
         return True
 
+    def _cufd_vigente(self):
+        lane = self._sfv_lane()
+        return self.env['l10n_bo_bill.cufd']._get_cufd_vigente(lane['id_sucursal'], lane['id_punto_venta'])
+
+    def _emitir_lote(self):
+        """Emite varias facturas repartiendo las llamadas HTTP en un pool de hilos.
+
+        Las validaciones y escrituras se hacen en el cursor principal; las
+        llamadas a la API no tocan el ORM. Las facturas de puntos de venta en
+        contingencia se emiten localmente. Devuelve ``{move_id: error}``, con
+        ``error`` en ``None`` para las facturas emitidas correctamente.
+        """
+        config = self._get_config_api()
+        en_contingencia = self.filtered(lambda f: f._sfv_lane()['contingencia'])
+        resultados = en_contingencia._emitir_contingencia_local() if en_contingencia else {}
+        facturas = self - en_contingencia
+        if not facturas:
+            return resultados
+
+        url = f"{self._get_api_url()}/factura/emitir-computarizada"
+        max_hilos = config.get('max_hilos_emision') or 1
+
+        payloads, errores = facturas._preparar_payloads_emision(config)
+        resultados.update(errores)
+        pendientes = [
+            (factura.id, factura.name, payloads[factura.id], factura._sfv_idempotency_key('emitir'))
+            for factura in facturas if factura.id in payloads
+        ]
+
+        _logger.info("Emisión en lote: %s facturas, %s hilos", len(pendientes), max_hilos)
+        debug = config.get('debug')
+        respuestas = sfv_client.map_concurrent(
+            lambda item: _emitir_en_api(url, item[2], item[0], debug, item[3]),
+            pendientes,
+            max_hilos,
+        )
+
+        emisiones = []
+        for (move_id, _name, _payload, _clave), data, error in respuestas:
+            if error:
+                resultados[move_id] = str(error)
+                continue
+            cufd = self.browse(move_id)._cufd_vigente()
+            emisiones.append((move_id, data, cufd['codigo'] if cufd else None))
+
+        # El CUF ya existe en el SFV: se guarda aunque luego falle la publicación
+        self._guardar_emisiones(emisiones)
+        emitidas = self.browse([e[0] for e in emisiones])
+        errores = emitidas._publicar_emitidas()
+        for move_id, data, _cufd in emisiones:
+            error = errores.get(move_id)
+            if error:
+                _logger.error("Factura %s emitida (CUF %s) pero no se pudo publicar: %s", move_id, data['cuf'], error)
+            resultados[move_id] = error
+        _logger.info("Emisión en lote: %s emitidas, %s sin publicar", len(emisiones), len(errores))
+
+        return resultados
+
+    def _accion_reporte_emision(self, resultados):
+        """Notificación con el resumen de una emisión en lote."""
+        errores = {move_id: error for move_id, error in resultados.items() if error}
+        emitidas = len(resultados) - len(errores)
+        nombres = {m.id: m.name for m in self.browse(list(errores))}
+        detalle = "\n".join(f"- {nombres[move_id]}: {error}" for move_id, error in errores.items())
+        mensaje = f"Facturas emitidas: {emitidas}. Con error: {len(errores)}."
+        if detalle:
+            mensaje = f"{mensaje}\n{detalle}"
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': "Envío a impuestos",
+                'message': mensaje,
+                'type': 'warning' if errores else 'success',
+                'sticky': bool(errores),
+            },
+        }
+
     #Llamar Wizard Revertir factura
     def action_open_reversal_wizard(self):
         return {
@@ -258,22 +864,63 @@ class AccountMove(models.Model):
             }
         }
 
+    def _anular_en_sfv(self, motivo):
+        """Anula las facturas en el SFV con llamadas concurrentes.
+
+        Las anuladas se marcan con una sola escritura. Devuelve
+        ``{move_id: error}`` con las facturas que no se pudieron anular.
+        """
+        config = self._get_config_api()
+        url = f"{self._get_api_url()}/factura/anular"
+        pendientes = []
+        for factura in self:
+            lane = factura._sfv_lane()
+            pendientes.append((factura.id, {
+                "cuf": factura.l10n_bo_cuf,
+                "numeroFactura": int(factura.l10n_bo_invoice_number),
+                "anulacionMotivo": motivo,
+                "idPuntoVenta": lane['id_punto_venta'],
+                "idSucursal": lane['id_sucursal']
+            }, factura._sfv_idempotency_key('anular')))
+
+        _logger.info("Anulación: %s facturas, motivo %s", len(pendientes), motivo)
+        respuestas = sfv_client.map_concurrent(
+            lambda item: _anular_en_api(url, item[1], item[0], item[2]),
+            pendientes,
+            config.get('max_hilos_emision') or 1,
+        )
+
+        errores = {}
+        anuladas = []
+        for (move_id, _payload, _clave), _data, error in respuestas:
+            if error:
+                _logger.error("Error al anular la factura %s: %s", move_id, error)
+                errores[move_id] = str(error)
+            else:
+                anuladas.append(move_id)
+        self.browse(anuladas).write({'is_cancelled': True})
+        _logger.info("Anulación: %s anuladas, %s con error", len(anuladas), len(errores))
+        return errores
+
     def revertir_anulacion(self):
         for factura in self:
             if not factura.l10n_bo_cuf:
                 raise UserError("La factura no tiene un CUF asignado.")
 
+            lane = factura._sfv_lane()
             payload = {
                 "cuf": factura.l10n_bo_cuf,
-                "idPuntoVenta": 1,
-                "idSucursal": 1
+                "idPuntoVenta": lane['id_punto_venta'],
+                "idSucursal": lane['id_sucursal']
             }
 
             api_url = self._get_api_url()
             url = f"{api_url}/factura/reversion-anular"
 
             try:
-                response = requests.post(url, json=payload, timeout=10)
+                response = sfv_client.post(
+                    url, json=payload, ref=factura.id, idempotency_key=factura._sfv_idempotency_key('revertir')
+                )
                 response.raise_for_status()
                 data = response.json()
 
@@ -285,6 +932,8 @@ class AccountMove(models.Model):
                     'is_cancelled': False,
                     'is_reverted': True
                 })
+                # Una nueva anulación será otra operación para el SFV
+                factura._renovar_idempotency_key()
 
                 _logger.info(f"Reversión de anulación, factura {factura.name}.")
 
@@ -293,14 +942,127 @@ class AccountMove(models.Model):
                 raise UserError(f"Error al revertir la anulación en la API: {e}")
         return True
     
-    def action_download_invoice_pdf(self):
-        #Descargar pdf factura
-        if not self.l10n_bo_cuf or not self.l10n_bo_invoice_number:
-            raise UserError(_("No hay CUF o número de factura disponible para esta factura."))
+    def init(self):
+        super().init()
+        # Recorrido por marca de la conciliación de estados: solo facturas de
+        # cliente, para no mantener un índice sobre todos los asientos
+        self.env.cr.execute("DROP INDEX IF EXISTS account_move_write_date_id_idx")
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS account_move_out_invoice_write_date_id_idx
+                ON account_move (write_date, id)
+             WHERE move_type = 'out_invoice'
+        """)
 
-        direccion_api = self._get_api_url()  
-        base_url = direccion_api
+    @api.model
+    def _leer_marca_conciliacion(self):
+        valor = self.env['ir.config_parameter'].sudo().get_param(PARAM_MARCA_CONCILIACION)
+        if not valor:
+            return datetime.min, 0
+        fecha, move_id = valor.rsplit(',', 1)
+        return datetime.fromisoformat(fecha), int(move_id)
+
+    @api.model
+    def _guardar_marca_conciliacion(self, fecha, move_id):
+        self.env['ir.config_parameter'].sudo().set_param(PARAM_MARCA_CONCILIACION, f"{fecha.isoformat()},{move_id}")
 
+    @api.model
+    def _cambios_estado_sfv(self, facturas, estados):
+        """Valores a escribir por factura según los estados devueltos por el SFV.
+
+        ``facturas`` son filas ``(id, cuf, is_confirmed, is_cancelled, valid_nit)``;
+        solo se devuelven las facturas cuyo estado local difiere.
+        """
+        por_cuf = {estado.get('cuf'): estado for estado in estados}
+        cambios = {}
+        for move_id, cuf, is_confirmed, is_cancelled, valid_nit in facturas:
+            estado = por_cuf.get(cuf)
+            if not estado:
+                continue
+            try:
+                vals = dict(ESTADOS_SFV.get(int(estado.get('codigoEstado')), {}))
+            except (TypeError, ValueError):
+                vals = {}
+            if estado.get('nitValido') is not None:
+                vals['valid_nit'] = bool(estado['nitValido'])
+            actual = {'is_confirmed': is_confirmed, 'is_cancelled': is_cancelled, 'valid_nit': valid_nit}
+            vals = {campo: valor for campo, valor in vals.items() if actual[campo] != valor}
+            if vals:
+                cambios[move_id] = vals
+        return cambios
+
+    @api.model
+    def _cron_conciliar_estados(self, tiempo_maximo=240):
+        """Concilia con el SFV el estado de las facturas emitidas o modificadas desde la última ejecución.
+
+        Recorre las facturas con CUF en orden ``(write_date, id)`` a partir de
+        la marca guardada, consulta sus estados en bloques concurrentes y
+        agrupa las escrituras por valores iguales. Cada lote se confirma junto
+        con la nueva marca, de modo que una ejecución interrumpida retoma
+        donde quedó. La marca no pasa de ``MARGEN_CONCILIACION`` antes del
+        inicio, para no saltar facturas de transacciones aún abiertas.
+
+        Usa ``/factura/estado``, que la API del SFV todavía no publica: el
+        cron se instala inactivo.
+        """
+        if self._sfv_sin_conexion():
+            _logger.warning("Conciliación de estados en espera: SFV sin conexión")
+            return
+        config = self._get_config_api()
+        url = f"{self._get_api_url()}/factura/estado"
+        max_hilos = config.get('max_hilos_emision') or 1
+        fecha, ultimo_id = self._leer_marca_conciliacion()
+        limite = fields.Datetime.now() - MARGEN_CONCILIACION
+
+        inicio = time.monotonic()
+        while time.monotonic() - inicio < tiempo_maximo:
+            self.env.cr.execute("""
+                SELECT m.id, f.cuf, m.is_confirmed, m.is_cancelled, m.valid_nit, m.write_date
+                  FROM account_move m
+                  JOIN l10n_bo_bill_factura_fiscal f ON f.move_id = m.id
+                 WHERE m.move_type = 'out_invoice'
+                   AND f.cuf IS NOT NULL
+                   AND (m.write_date, m.id) > (%s, %s)
+                   AND m.write_date <= %s
+              ORDER BY m.write_date, m.id
+                 LIMIT %s
+            """, (fecha, ultimo_id, limite, LOTE_CONCILIACION))
+            filas = self.env.cr.fetchall()
+            if not filas:
+                break
+
+            respuestas = sfv_client.map_concurrent(
+                lambda bloque: _consultar_estados_api(url, [fila[1] for fila in bloque]),
+                list(split_every(CUFS_POR_CONSULTA, filas, list)),
+                max_hilos,
+            )
+            estados = []
+            for _bloque, datos, error in respuestas:
+                if error:
+                    # La marca no avanza: el lote se vuelve a consultar en la próxima ejecución
+                    _logger.error("Conciliación de estados interrumpida: %s", error)
+                    return
+                estados.extend(datos)
+
+            cambios = self._cambios_estado_sfv([fila[:5] for fila in filas], estados)
+            grupos = {}
+            for move_id, vals in cambios.items():
+                grupos.setdefault(tuple(sorted(vals.items())), []).append(move_id)
+            for vals, ids in grupos.items():
+                self.browse(ids).write(dict(vals))
+
+            fecha, ultimo_id = filas[-1][5], filas[-1][0]
+            self._guardar_marca_conciliacion(fecha, ultimo_id)
+            self.env.cr.commit()
+            _logger.info("Conciliación de estados: %s facturas revisadas, %s actualizadas", len(filas), len(cambios))
+
+    def _clave_pdf(self):
+        """Clave de caché del PDF: cambia al anular o revertir la factura."""
+        estado = 'anulada' if self.is_cancelled else ('revertida' if self.is_reverted else 'valida')
+        return f"{self.l10n_bo_cuf}:{self.l10n_bo_invoice_number}:{estado}"
+
+    def _url_pdf(self):
+        self.ensure_one()
+        base_url = self._get_api_url()
         if not base_url.startswith("http"):
             base_url = "http://" + base_url
         full_base_url = f"{base_url}/pdf/download"
@@ -309,97 +1071,232 @@ class AccountMove(models.Model):
             'cufd': self.l10n_bo_cuf,
             'numeroFactura': self.l10n_bo_invoice_number
         }
+        return requests.Request('GET', full_base_url, params=params).prepare().url
+
+    def _pdf_vigente(self, local=False):
+        """Adjunto en caché si sigue siendo válido para el estado actual de la factura.
+
+        Con ``local=True`` también sirve la representación generada en Odoo.
+        """
+        self.ensure_one()
+        claves = (self._clave_pdf(), self._clave_pdf_local()) if local else (self._clave_pdf(),)
+        if self.sfv_pdf_attachment_id and self.sfv_pdf_clave in claves:
+            return self.sfv_pdf_attachment_id
+        return self.env['ir.attachment']
+
+    def _clave_pdf_local(self):
+        # Distinta de la del SFV: el PDF oficial reemplaza al local en cuanto se descarga
+        return f"local:{self._clave_pdf()}"
+
+    def _guardar_pdf(self, contenido, clave=None):
+        """Guarda el PDF generado reutilizando el adjunto existente de la factura."""
+        self.ensure_one()
+        attachment = self.sfv_pdf_attachment_id
+        if attachment:
+            # Mismo adjunto; el archivo solo se reescribe si el contenido cambió
+            if attachment.checksum != hashlib.sha1(contenido).hexdigest():
+                attachment.write({'raw': contenido})
+        else:
+            attachment = self.env['ir.attachment'].create({
+                'name': 'Factura-%s.pdf' % self.l10n_bo_invoice_number,
+                'type': 'binary',
+                'raw': contenido,
+                'res_model': 'account.move',
+                'res_id': self.id,
+                'mimetype': 'application/pdf',
+            })
+        self.write({'sfv_pdf_attachment_id': attachment.id, 'sfv_pdf_clave': clave or self._clave_pdf()})
+        return attachment
 
-        full_url = requests.Request('GET', full_base_url, params=params).prepare().url
-        _logger.info("URL completa para la descarga del PDF: %s", full_url)
-
+    @api.model
+    def _directorio_descarga_pdf(self):
+        """Directorio donde se descargan los PDF: el filestore, para moverlos sin copiarlos."""
+        attachment = self.env['ir.attachment']
+        if attachment._storage() == 'file':
+            return attachment._filestore()
+        return tempfile.gettempdir()
+
+    def _guardar_pdf_descargado(self, temporal, checksum, tamano):
+        """Registra como adjunto el PDF que la descarga dejó en disco, sin volver a leerlo.
+
+        El temporal se mueve a su ruta del filestore y el adjunto se enlaza
+        con ``store_fname`` y ``checksum``; ``ir.attachment`` no permite
+        escribir esas columnas, por eso se actualizan por SQL. Si algo falla
+        antes de moverlo, el temporal se elimina.
+        """
+        self.ensure_one()
         try:
-            response = requests.get(full_url)
-            if response.status_code == 200:
-                # Codificar el contenido binario del PDF a base64
-                pdf_content = base64.b64encode(response.content)
-                attachment = self.env['ir.attachment'].create({
-                    'name': 'Factura-%s.pdf' % self.l10n_bo_invoice_number,
-                    'type': 'binary',
-                    'datas': pdf_content,
-                    'res_model': 'account.move',
-                    'res_id': self.id,
-                    'mimetype': 'application/pdf',
-                })
-                return attachment.id
+            return self._enlazar_pdf_descargado(temporal, checksum, tamano)
+        except Exception:
+            if os.path.exists(temporal):
+                os.unlink(temporal)
+            raise
+
+    def _enlazar_pdf_descargado(self, temporal, checksum, tamano):
+        Attachment = self.env['ir.attachment']
+        attachment = self.sfv_pdf_attachment_id
+        if attachment and attachment.checksum == checksum:
+            os.unlink(temporal)
+            self.write({'sfv_pdf_clave': self._clave_pdf()})
+            return attachment
+
+        if Attachment._storage() != 'file':
+            with open(temporal, 'rb') as archivo:
+                contenido = archivo.read()
+            os.unlink(temporal)
+            return self._guardar_pdf(contenido)
+
+        # Misma ruta que ``_get_path`` daría al contenido, sin tenerlo en memoria
+        fname = checksum[:2] + '/' + checksum
+        destino = Attachment._full_path(fname)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if os.path.exists(destino):
+            os.unlink(temporal)
+        else:
+            os.replace(temporal, destino)
+        # Si la transacción se revierte, el recolector del filestore lo elimina
+        Attachment._mark_for_gc(fname)
+
+        anterior = attachment.store_fname
+        if not attachment:
+            attachment = Attachment.create({
+                'name': 'Factura-%s.pdf' % self.l10n_bo_invoice_number,
+                'type': 'binary',
+                'res_model': 'account.move',
+                'res_id': self.id,
+                'mimetype': 'application/pdf',
+            })
+        self.env.cr.execute("""
+            UPDATE ir_attachment
+               SET store_fname = %s, checksum = %s, file_size = %s, db_datas = NULL, mimetype = 'application/pdf'
+             WHERE id = %s
+        """, (fname, checksum, tamano, attachment.id))
+        attachment.invalidate_recordset()
+        if anterior and anterior != fname:
+            Attachment._file_delete(anterior)
+        self.write({'sfv_pdf_attachment_id': attachment.id, 'sfv_pdf_clave': self._clave_pdf()})
+        return attachment
+
+    def _representacion_local_requerida(self):
+        """El SFV no puede entregar el PDF: sin conexión o factura aún no registrada por contingencia."""
+        self.ensure_one()
+        return (
+            self._sfv_sin_conexion()
+            or self._sfv_lane()['contingencia']
+            or (self.is_offline and not self.sfv_contingencia_enviada)
+        )
+
+    def _reporte_representacion(self):
+        self.ensure_one()
+        if self.representation_size:
+            return 'l10n_bo_bill.action_report_factura_rollo'
+        return 'l10n_bo_bill.action_report_factura_carta'
+
+    def _totales_representacion(self):
+        """Importes del pie de la representación gráfica, calculados desde las líneas.
+
+        El subtotal es cantidad por precio unitario; el descuento, su
+        diferencia con el subtotal neto de cada línea.
+        """
+        self.ensure_one()
+        lineas = self.invoice_line_ids.filtered(lambda l: l.display_type == 'product')
+        redondear = self.currency_id.round
+        subtotal = redondear(sum(linea.quantity * linea.price_unit for linea in lineas))
+        total = redondear(sum(lineas.mapped('price_subtotal')))
+        return {
+            'subtotal': subtotal,
+            'descuento': redondear(subtotal - total),
+            'total': total,
+            'monto_pagar': self.amount_total,
+            'base_credito_fiscal': self.amount_untaxed,
+        }
+
+    def _representacion_local(self):
+        """Genera en Odoo la representación gráfica de las facturas que no la tienen en caché.
+
+        Las facturas de un mismo formato se renderizan en una sola pasada de
+        wkhtmltopdf. Devuelve ``{move_id: adjunto}``.
+        """
+        reporte = self.env['ir.actions.report'].sudo()
+        adjuntos = {}
+        grupos = {}
+        for factura in self:
+            attachment = factura._pdf_vigente(local=True)
+            if attachment:
+                adjuntos[factura.id] = attachment
             else:
-                _logger.error("Error al descargar el PDF. Código de estado: %s. Respuesta: %s", response.status_code, response.text)
-                raise UserError(_("Error al descargar el PDF. Código de estado: %s" % response.status_code))
-        except requests.exceptions.RequestException as e:
-            raise UserError(_("Error al conectar con la API: %s" % e))
-        
-    def action_invoice_preview(self):
-        #Previsualizacion Factura
+                grupos.setdefault(factura._reporte_representacion(), self.browse())
+                grupos[factura._reporte_representacion()] |= factura
+
+        for xmlid, facturas in grupos.items():
+            streams = reporte._render_qweb_pdf_prepare_streams(xmlid, {}, res_ids=facturas.ids)
+            if any(not (streams.get(move_id) or {}).get('stream') for move_id in facturas.ids):
+                # El PDF no se pudo separar por factura (las entradas quedan sin
+                # stream y el documento entero va en la clave False): una por una
+                streams = {
+                    factura.id: reporte._render_qweb_pdf_prepare_streams(xmlid, {}, res_ids=factura.ids)[factura.id]
+                    for factura in facturas
+                }
+            for factura in facturas:
+                contenido = streams[factura.id]['stream'].getvalue()
+                adjuntos[factura.id] = factura._guardar_pdf(contenido, factura._clave_pdf_local())
+            _logger.info("Representación local generada para %s facturas (%s)", len(facturas), xmlid)
+        return adjuntos
+
+    def _obtener_pdf_attachment(self):
+        """Adjunto con el PDF de la factura, descargado solo si cambió su clave.
+
+        Si el SFV no puede entregarlo, o la descarga falla, se usa la
+        representación gráfica generada en Odoo.
+        """
+        self.ensure_one()
         if not self.l10n_bo_cuf or not self.l10n_bo_invoice_number:
             raise UserError(_("No hay CUF o número de factura disponible para esta factura."))
 
-        direccion_api = self._get_api_url()
-        base_url = direccion_api
-        if not base_url.startswith("http"):
-            base_url = "http://" + base_url
-        full_base_url = f"{base_url}/pdf/download"
-
-        params = {
-            'cufd': self.l10n_bo_cuf,
-            'numeroFactura': self.l10n_bo_invoice_number
+        attachment = self._pdf_vigente()
+        if attachment:
+            return attachment
+        if not self._representacion_local_requerida():
+            try:
+                return self._guardar_pdf_descargado(*_descargar_pdf_url(self._url_pdf(), self._directorio_descarga_pdf()))
+            except UserError as e:
+                _logger.warning("PDF del SFV no disponible para %s (%s); se usa la representación local", self.name, e)
+        return self._representacion_local()[self.id]
+
+    def action_exportar_pdfs_zip(self):
+        """Descarga en un ZIP los PDF de las facturas seleccionadas."""
+        facturas = self.filtered(lambda f: f.l10n_bo_cuf and f.l10n_bo_invoice_number)
+        if not facturas:
+            raise UserError(_("Ninguna de las facturas seleccionadas tiene CUF y número de factura."))
+        exportacion = self.env['l10n_bo_bill.exportacion_pdf'].create({
+            'move_ids': [(6, 0, facturas.ids)],
+            'total': len(facturas),
+        })
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/l10n_bo_bill/exportacion_pdf/%s' % exportacion.id,
+            'target': 'new',
         }
 
-        full_url = requests.Request('GET', full_base_url, params=params).prepare().url
-        _logger.info("URL completa para la previsualización del PDF: %s", full_url)
-
-        try:
-            response = requests.get(full_url)
-            if response.status_code == 200:
-                pdf_content = base64.b64encode(response.content)
-                
-                attachment = self.env['ir.attachment'].create({
-                    'name': 'Factura-%s.pdf' % self.l10n_bo_invoice_number,
-                    'type': 'binary',
-                    'datas': pdf_content,
-                    'res_model': 'account.move',
-                    'res_id': self.id,
-                    'mimetype': 'application/pdf',
-                })
-
-                return {
-                    'type': 'ir.actions.act_url',
-                    'url': '/web/content/%s?download=false' % attachment.id,
-                    'target': 'new',
-                }
-            else:
-                _logger.error("Error al descargar el PDF. Código de estado: %s. Respuesta: %s", response.status_code, response.text)
-                raise UserError(_("Error al descargar el PDF. Código de estado: %s" % response.status_code))
-        except requests.exceptions.RequestException as e:
-            raise UserError(_("Error al conectar con la API: %s" % e))
+    def action_download_invoice_pdf(self):
+        #Descargar pdf factura
+        return self._obtener_pdf_attachment().id
+        
+    def action_invoice_preview(self):
+        #Previsualizacion Factura
+        attachment = self._obtener_pdf_attachment()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=false' % attachment.id,
+            'target': 'new',
+        }
         
         
     def verificar_comunicacion(self):
-        base_url = self._get_api_url()
-        url = f"{base_url}/contingencia/verificar-comunicacion"
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                try:
-                    respuesta_json = response.json()
-                    _logger.info("Respuesta de verificación de comunicación: %s", respuesta_json)
-
-                    if respuesta_json.get("mensaje", "").lower() != "conexion exitosa":
-                        return self.action_mostrar_wizard_contingencia()
-
-                except json.JSONDecodeError:
-                    _logger.warning("Respuesta inválida (no JSON), mostrando wizard.")
-                    return self.action_mostrar_wizard_contingencia()
-            else:
-                _logger.error("Error al verificar la comunicación. Código: %s. Respuesta: %s", response.status_code, response.text)
-                return self.action_mostrar_wizard_contingencia()
-
-        except requests.exceptions.RequestException as e:
-            _logger.error("Error al conectar con la API de contingencia: %s", e)
+        config = self._get_config_api()
+        if not config:
+            raise UserError("No se encontró una configuración de la API activa.")
+        if not self.env['l10n_bo_bill.direccion_api'].browse(config['id'])._probar_comunicacion():
             return self.action_mostrar_wizard_contingencia()
         
           
@@ -419,50 +1316,12 @@ class AccountMove(models.Model):
             
     def action_download_invoice_pdf_true(self):
         """Función para descargar el PDF de la factura desde la API."""
-        if not self.l10n_bo_cuf or not self.l10n_bo_invoice_number:
-            raise UserError(_("No hay CUF o número de factura disponible para esta factura."))
-
-        direccion_api = self._get_api_url()  
-        base_url = direccion_api
-        
-        if not base_url.startswith("http"):
-            base_url = "http://" + base_url
-
-        full_base_url = f"{base_url}/pdf/download"
-
-        params = {
-            'cufd': self.l10n_bo_cuf,
-            'numeroFactura': self.l10n_bo_invoice_number
+        attachment = self._obtener_pdf_attachment()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % attachment.id,
+            'target': 'new',
         }
-
-        full_url = requests.Request('GET', full_base_url, params=params).prepare().url
-        _logger.info("URL completa para la descarga del PDF: %s", full_url)
-
-        try:
-            response = requests.get(full_url)
-
-            if response.status_code == 200:
-                pdf_content = base64.b64encode(response.content)
-
-                attachment = self.env['ir.attachment'].create({
-                    'name': 'Factura-%s.pdf' % self.l10n_bo_invoice_number,
-                    'type': 'binary',
-                    'datas': pdf_content,
-                    'res_model': 'account.move',
-                    'res_id': self.id,
-                    'mimetype': 'application/pdf',
-                })
-
-                return {
-                    'type': 'ir.actions.act_url',
-                    'url': '/web/content/%s?download=true' % attachment.id,
-                    'target': 'new',
-                }
-            else:
-                _logger.error("Error al descargar el PDF. Código de estado: %s. Respuesta: %s", response.status_code, response.text)
-                raise UserError(_("Error al descargar el PDF. Código de estado: %s" % response.status_code))
-        except requests.exceptions.RequestException as e:
-            raise UserError(_("Error al conectar con la API: %s" % e))
         
     def abrir_url(self):
         """Abre la URL almacenada en el campo url del registro"""
@@ -478,23 +1337,42 @@ class AccountMove(models.Model):
     
     
     def fin_de_contingencia(self):
+        return self._finalizar_contingencia(self[:1].l10n_bo_selling_point.id)
+
+    @api.model
+    def _finalizar_contingencia(self, selling_point_id=False):
+        """Cierra el evento de contingencia del punto de venta y emite su paquete."""
         _logger.info("Iniciando proceso para finalizar la contingencia.")
-        direccion_api = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
+        lane = self.env['selling_point']._get_lane(selling_point_id)
 
-        if not direccion_api or not direccion_api.contingencia:
+        if not lane['contingencia']:
             raise UserError("No hay contingencia activa registrada.")
 
-        evento_id = direccion_api.evento_id
+        evento_id = lane['evento_id']
         if not evento_id:
             raise UserError("No se encontró un ID de evento para finalizar la contingencia.")
 
+        # Primero se registran en el SFV las facturas emitidas localmente
+        errores = self._enviar_paquete_contingencia(selling_point_id)
+        if errores:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': "Fin de contingencia",
+                    'message': "La contingencia sigue activa; no se pudieron enviar:\n" + "\n".join(errores),
+                    'type': 'warning',
+                    'sticky': True,
+                },
+            }
+
         api_url = self._get_api_url()
         url = f"{api_url}/contingencia/registrar-fin-evento/{evento_id}"
 
         _logger.info(f"Enviando solicitud para finalizar contingencia a: {url}")
 
         try:
-            response = requests.post(url, timeout=60)
+            response = sfv_client.post(url)
             response.raise_for_status()
             data = response.json()
             _logger.info(f"Respuesta finalización contingencia: {data}")
@@ -506,16 +1384,16 @@ class AccountMove(models.Model):
                 raise UserError(f"No se confirmó la finalización de la contingencia: {data}")
 
             # Limpiar estado de contingencia
-            direccion_api.write({
+            self.env['selling_point']._registro_contingencia(selling_point_id).write({
                 'contingencia': False,
-                'evento_id': None
+                'evento_id': False
             })
             _logger.info("✅ Contingencia desactivada correctamente.")
 
             #Emitir paquete
-            emitir_url = f"{api_url}/factura/emitir-paquete/1/1/{evento_id}"
+            emitir_url = f"{api_url}/factura/emitir-paquete/{lane['id_sucursal']}/{lane['id_punto_venta']}/{evento_id}"
             _logger.info(f"Emitiendo paquete tras finalizar contingencia: {emitir_url}")
-            emitir_response = requests.post(emitir_url, timeout=60)
+            emitir_response = sfv_client.post(emitir_url)
             emitir_response.raise_for_status()
             emitir_data = emitir_response.json()
             _logger.info(f"Respuesta de emisión de paquete: {emitir_data}")
@@ -526,10 +1404,16 @@ class AccountMove(models.Model):
         
     @api.model
     def finalizar_contingencia_automatica(self):
-        """Finaliza automáticamente la contingencia si sigue activa"""
-        direccion_api = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
-        if direccion_api and direccion_api.contingencia:
-            _logger.info("Finalizando contingencia automáticamente (por cron)")
-            return self.env['account.move'].fin_de_contingencia()
-        _logger.info("No hay contingencia activa, no se realiza acción.")
+        """Finaliza automáticamente la contingencia de los puntos de venta donde sigue activa"""
+        carriles = self.env['selling_point']._carriles_en_contingencia()
+        if not carriles:
+            _logger.info("No hay contingencia activa, no se realiza acción.")
+            return True
+        for selling_point_id in carriles:
+            _logger.info("Finalizando contingencia automáticamente (por cron), punto de venta: %s", selling_point_id)
+            try:
+                with self.env.cr.savepoint():
+                    self._finalizar_contingencia(selling_point_id)
+            except UserError as e:
+                _logger.error("No se pudo finalizar la contingencia del punto de venta %s: %s", selling_point_id, e)
         return True
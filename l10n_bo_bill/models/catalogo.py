@@ -0,0 +1,184 @@
+from odoo import models, fields, api, tools
+from odoo.exceptions import UserError
+from datetime import timedelta
+import hashlib
+import json
+import requests
+from ..tools import sfv_client
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Tiempo de vida de cada catálogo antes de volver a consultarlo en la API
+CATALOGO_TTL = timedelta(hours=12)
+
+# Códigos de producto SIN habilitados para este contribuyente
+CODIGOS_PRODUCTO_PERMITIDOS = {
+    "87290", "45220", "61284", "61285", "61289", "612849", "612859", "612899",
+    "872909", "83141", "83143", "831419", "831439"
+}
+
+
+class Catalogo(models.Model):
+    _name = 'l10n_bo_bill.catalogo'
+    _inherit = 'l10n_bo_bill.sfv_mixin'
+    _description = 'Catálogo paramétrico SIN'
+    _rec_name = 'tipo'
+
+    tipo = fields.Selection(
+        [
+            ('metodo_pago', 'Métodos de Pago'),
+            ('unidad_medida', 'Unidades de Medida'),
+            ('producto', 'Códigos de Producto SIN'),
+            ('identidad', 'Tipos de Documento de Identidad'),
+            ('evento', 'Eventos Significativos'),
+            ('motivo_anulacion', 'Motivos de Anulación'),
+        ],
+        string='Tipo',
+        required=True,
+        readonly=True,
+    )
+    version = fields.Integer(string='Versión', default=0, readonly=True)
+    checksum = fields.Char(string='Checksum', readonly=True)
+    fecha_sincronizacion = fields.Datetime(string='Última Sincronización', readonly=True)
+    valor_ids = fields.One2many('l10n_bo_bill.catalogo_valor', 'catalogo_id', string='Valores', readonly=True)
+
+    _sql_constraints = [
+        ('tipo_unique', 'unique(tipo)', 'Solo puede existir un catálogo por tipo.'),
+    ]
+
+    # Endpoint y claves de la respuesta de la API por tipo de catálogo
+    _ENDPOINTS = {
+        'metodo_pago': ('/parametro/metodo-pago', 'codigoClasificador', 'descripcion'),
+        'unidad_medida': ('/parametro/unidad-medida', 'codigoClasificador', 'descripcion'),
+        'producto': ('/productos', 'codigoProducto', 'descripcionProducto'),
+        'identidad': ('/parametro/identidad', 'codigoClasificador', 'descripcion'),
+        'evento': ('/parametro/eventos-significativos', 'codigoClasificador', 'descripcion'),
+        'motivo_anulacion': ('/parametro/motivo-anulacion', 'codigoClasificador', 'descripcion'),
+    }
+
+    @api.model
+    def _get_selection(self, tipo):
+        """Opciones de un catálogo para campos Selection, servidas desde caché.
+
+        Mientras el catálogo no se haya sincronizado (instalación reciente o
+        antes de la primera ejecución del cron) se consultan en la API.
+        """
+        opciones = self._get_selection_cached(tipo)
+        if not opciones:
+            return self._get_selection_api(tipo)
+        return list(opciones)
+
+    @api.model
+    def _get_selection_api(self, tipo):
+        """Opciones leídas directamente de la API; no se guardan ni se cachean."""
+        try:
+            valores = self._descargar_valores(tipo)
+        except (requests.exceptions.RequestException, UserError, ValueError) as e:
+            _logger.warning("Catálogo %s sin sincronizar y no disponible en la API: %s", tipo, e)
+            return []
+        return [(codigo, f"{codigo} - {descripcion}") for codigo, descripcion in valores]
+
+    @api.model
+    @tools.ormcache('tipo')
+    def _get_selection_cached(self, tipo):
+        self.env.cr.execute("""
+            SELECT v.codigo, v.descripcion
+              FROM l10n_bo_bill_catalogo_valor v
+              JOIN l10n_bo_bill_catalogo c ON c.id = v.catalogo_id
+             WHERE c.tipo = %s
+          ORDER BY v.sequence, v.id
+        """, (tipo,))
+        return tuple(
+            (codigo, f"{codigo} - {descripcion or 'Sin descripción'}")
+            for codigo, descripcion in self.env.cr.fetchall()
+        )
+
+    def _descargar_valores(self, tipo):
+        """Consulta la API y devuelve la lista ordenada de (codigo, descripcion)."""
+        path, clave_codigo, clave_descripcion = self._ENDPOINTS[tipo]
+        url = f"{self._get_api_url()}{path}"
+
+        response = sfv_client.get(url)
+        response.raise_for_status()
+        datos = response.json()
+
+        if not isinstance(datos, list):
+            raise UserError(f"La API no devolvió una lista válida para el catálogo {tipo}.")
+
+        seen = set()
+        valores = []
+        for d in datos:
+            if not d.get(clave_codigo):
+                continue
+            codigo = str(d.get(clave_codigo))
+            if tipo == 'producto' and codigo not in CODIGOS_PRODUCTO_PERMITIDOS:
+                continue
+            if codigo not in seen:
+                seen.add(codigo)
+                valores.append((codigo, d.get(clave_descripcion) or 'Sin descripción'))
+        return valores
+
+    @api.model
+    def _sincronizar(self, tipo):
+        """Sincroniza un catálogo; solo crea una nueva versión si su contenido cambió."""
+        catalogo = self.search([('tipo', '=', tipo)], limit=1) or self.create({'tipo': tipo})
+        valores = self._descargar_valores(tipo)
+        checksum = hashlib.sha1(json.dumps(valores).encode()).hexdigest()
+
+        if checksum == catalogo.checksum:
+            catalogo.fecha_sincronizacion = fields.Datetime.now()
+            return False
+
+        catalogo.valor_ids.unlink()
+        catalogo.write({
+            'version': catalogo.version + 1,
+            'checksum': checksum,
+            'fecha_sincronizacion': fields.Datetime.now(),
+            'valor_ids': [
+                (0, 0, {'sequence': i, 'codigo': codigo, 'descripcion': descripcion})
+                for i, (codigo, descripcion) in enumerate(valores)
+            ],
+        })
+        # Invalida la caché en este worker y la señala al resto
+        self.env.registry.clear_cache()
+        _logger.info("Catálogo %s actualizado a la versión %s (%s valores)", tipo, catalogo.version, len(valores))
+        return True
+
+    def action_sincronizar(self):
+        for record in self:
+            try:
+                self._sincronizar(record.tipo)
+            except requests.exceptions.RequestException as e:
+                raise UserError(f"No se pudo actualizar el catálogo {record.tipo}: {e}")
+
+    @api.model
+    def cron_actualizar_catalogos(self, forzar=False):
+        """Refresca los catálogos cuya última sincronización supera el TTL."""
+        limite = fields.Datetime.now() - CATALOGO_TTL
+        sincronizados = {
+            c.tipo: c.fecha_sincronizacion for c in self.search([])
+        }
+        for tipo in self._ENDPOINTS:
+            fecha = sincronizados.get(tipo)
+            if not forzar and fecha and fecha > limite:
+                continue
+            try:
+                self._sincronizar(tipo)
+                self.env.cr.commit()
+            except (requests.exceptions.RequestException, UserError) as e:
+                self.env.cr.rollback()
+                _logger.error(f"Error al actualizar el catálogo {tipo}: {e}")
+
+
+class CatalogoValor(models.Model):
+    _name = 'l10n_bo_bill.catalogo_valor'
+    _description = 'Valor de catálogo SIN'
+    _order = 'catalogo_id, sequence, id'
+    _rec_name = 'descripcion'
+
+    catalogo_id = fields.Many2one('l10n_bo_bill.catalogo', string='Catálogo', required=True, ondelete='cascade', index=True)
+    tipo = fields.Selection(related='catalogo_id.tipo', store=True)
+    sequence = fields.Integer(string='Secuencia', default=0)
+    codigo = fields.Char(string='Código', required=True)
+    descripcion = fields.Char(string='Descripción')
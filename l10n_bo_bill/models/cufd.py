@@ -1,13 +1,33 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools
 from odoo.exceptions import UserError
 import requests
+from ..tools import sfv_client
 import logging
-from datetime import datetime
+import pytz
+import re
+from datetime import datetime, timedelta
 
 _logger = logging.getLogger(__name__)
 
+# Se renueva el CUFD cuando le queda menos que este margen de vigencia
+MARGEN_RENOVACION = timedelta(hours=2)
+
+
+def _fecha_utc(valor):
+    """Convierte una fecha ISO de la API (hora de Bolivia si no trae zona) a UTC naive."""
+    # fromisoformat de Python 3.10 no acepta 'Z', fracciones de cualquier
+    # largo ni zonas sin ':'; la fracción se descarta igual al guardar
+    valor = re.sub(r'\.\d+', '', valor.strip()).replace('Z', '+00:00')
+    valor = re.sub(r'([+-]\d{2})(\d{2})$', r'\1:\2', valor)
+    fecha = datetime.fromisoformat(valor)
+    if fecha.tzinfo is None:
+        fecha = pytz.timezone('America/La_Paz').localize(fecha)
+    return fecha.astimezone(pytz.utc).replace(tzinfo=None, microsecond=0)
+
+
 class Cufd(models.Model):
     _name = 'l10n_bo_bill.cufd'
+    _inherit = ['l10n_bo_bill.sfv_mixin', 'l10n_bo_bill.cache_mixin']
     _description = 'CUFD'
 
     codigo = fields.Char(string='Código CUFD')
@@ -15,73 +35,107 @@ class Cufd(models.Model):
     fecha_inicio = fields.Datetime(string='Fecha Creación')
     fecha_vigencia = fields.Datetime(string='Fecha Vigencia')
     vigente = fields.Boolean(string='Vigente', default=True)
+    id_sucursal = fields.Integer(string='ID Sucursal', default=1, required=True)
+    id_punto_venta = fields.Integer(string='ID Punto de Venta', default=1, required=True)
 
-    def _get_api_url(self):
-        direccion_apis = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
-        if not direccion_apis:
-            raise UserError("No se encontró una configuración de la API activa.")
-        if len(direccion_apis) > 1:
-            raise UserError("Hay más de una dirección de API activa.")
-        return direccion_apis.url
-
-    def obtener_cufd(self):
-        for record in self:
-            url = f"{record._get_api_url()}/codigos/obtener-cufd/1/1"
-            try:
-                response = requests.post(url, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-
-                if not data.get("estado"):
-                    raise UserError(f"Error en la API: {data.get('mensajeError') or 'Error desconocido'}")
-
-                # Marcar anteriores como no vigentes
-                self.env['l10n_bo_bill.cufd'].search([
-                    ('vigente', '=', True)
-                ]).write({'vigente': False})
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS l10n_bo_bill_cufd_vigente_lane_idx
+                ON l10n_bo_bill_cufd (id_sucursal, id_punto_venta, fecha_vigencia DESC)
+             WHERE vigente
+        """)
 
-                # Convertir fecha ISO a datetime de Python
-                fecha_inicio = fields.Datetime.from_string(data.get('fechaCreacion').replace("T", " ")[:19])
-                fecha_vigencia = fields.Datetime.from_string(data.get('fechaVigencia').replace("T", " ")[:19])
+    @api.model
+    def _get_cufd_vigente(self, id_sucursal=1, id_punto_venta=1):
+        """CUFD vigente de la sucursal/punto de venta, servido desde caché.
+
+        Devuelve un dict (id, codigo, codigo_control, fecha_vigencia) o None.
+        Un CUFD vencido se trata como ausente; la caché se renueva cuando se
+        crea o escribe el siguiente, no en cada consulta.
+        """
+        cufd = self._get_cufd_vigente_cached(id_sucursal, id_punto_venta)
+        if not cufd or cufd['fecha_vigencia'] <= fields.Datetime.now():
+            return None
+        return dict(cufd)
 
-                self.create({
-                    'codigo': data.get('codigo'),
-                    'codigo_control': data.get('codigoControl'),
-                    'fecha_inicio': fecha_inicio,
-                    'fecha_vigencia': fecha_vigencia,
-                    'vigente': True,
-                })
+    @api.model
+    @tools.ormcache('id_sucursal', 'id_punto_venta')
+    def _get_cufd_vigente_cached(self, id_sucursal, id_punto_venta):
+        cufds = self.sudo().search_read([
+            ('vigente', '=', True),
+            ('id_sucursal', '=', id_sucursal),
+            ('id_punto_venta', '=', id_punto_venta),
+        ], ['codigo', 'codigo_control', 'fecha_vigencia'], order='fecha_vigencia desc', limit=1)
+        return cufds[0] if cufds else None
 
-                _logger.info(f"CUFD creado correctamente: {data.get('codigo')}")
+    @api.model
+    def _obtener_de_api(self, id_sucursal, id_punto_venta):
+        """Solicita un CUFD nuevo para la sucursal/punto de venta y lo deja vigente."""
+        url = f"{self._get_api_url()}/codigos/obtener-cufd/{id_sucursal}/{id_punto_venta}"
+        response = sfv_client.post(url)
+        response.raise_for_status()
+        data = response.json()
+
+        if not data.get("estado"):
+            raise UserError(f"Error en la API: {data.get('mensajeError') or 'Error desconocido'}")
+
+        # Marcar anteriores de la misma sucursal/punto de venta como no vigentes
+        self.search([
+            ('vigente', '=', True),
+            ('id_sucursal', '=', id_sucursal),
+            ('id_punto_venta', '=', id_punto_venta),
+        ]).write({'vigente': False})
+
+        cufd = self.create({
+            'codigo': data.get('codigo'),
+            'codigo_control': data.get('codigoControl'),
+            'fecha_inicio': _fecha_utc(data.get('fechaCreacion')),
+            'fecha_vigencia': _fecha_utc(data.get('fechaVigencia')),
+            'vigente': True,
+            'id_sucursal': id_sucursal,
+            'id_punto_venta': id_punto_venta,
+        })
+        _logger.info(f"CUFD creado correctamente para {id_sucursal}/{id_punto_venta}: {data.get('codigo')}")
+        return cufd
 
+    def obtener_cufd(self):
+        for record in self:
+            try:
+                self._obtener_de_api(record.id_sucursal, record.id_punto_venta)
             except requests.exceptions.RequestException as e:
                 _logger.error(f"Error al obtener CUFD: {e}")
                 raise UserError(f"No se pudo obtener el CUFD: {e}")
 
+    @api.model
+    def _lanes_activas(self):
+        """Pares (id_sucursal, id_punto_venta) cuyo CUFD debe mantenerse vigente."""
+        self.env.cr.execute("""
+            SELECT DISTINCT b.external_id, s.external_id
+              FROM selling_point s
+              JOIN branch_office b ON b.id = s.branch_office_id
+             WHERE s.active AND b.active
+        """)
+        return set(self.env.cr.fetchall()) | {(1, 1)}
 
+    @api.model
+    def cron_renovar_cufd(self):
+        """Renueva antes de que venzan los CUFD de todas las sucursales/puntos de venta.
+
+        Así la primera factura del día encuentra un CUFD vigente en caché y
+        nunca espera una llamada a la API.
+        """
+        limite = fields.Datetime.now() + MARGEN_RENOVACION
+        for id_sucursal, id_punto_venta in sorted(self._lanes_activas()):
+            cufd = self._get_cufd_vigente(id_sucursal, id_punto_venta)
+            if cufd and cufd['fecha_vigencia'] > limite:
+                continue
+            try:
+                self._obtener_de_api(id_sucursal, id_punto_venta)
+                self.env.cr.commit()
+            except (requests.exceptions.RequestException, UserError) as e:
+                self.env.cr.rollback()
+                _logger.error(f"Error al renovar CUFD {id_sucursal}/{id_punto_venta} en cron: {e}")
 
     @api.model
     def cron_obtener_cufd_diario(self):
-        try:
-            url = f"{self._get_api_url()}/codigos/obtener-cufd/1/1"
-
-            response = requests.post(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("estado"):
-                self.search([('vigente', '=', True)]).write({'vigente': False})
-
-                self.create({
-                    'codigo': data.get('codigo'),
-                    'codigo_control': data.get('codigoControl'),
-                    'fecha_inicio': data.get('fechaCreacion'),
-                    'fecha_vigencia': data.get('fechaVigencia'),
-                    'vigente': True,
-                })
-                _logger.info("CUFD generado automáticamente desde el cron.")
-            else:
-                _logger.warning(f"Error al obtener CUFD desde cron: {data.get('mensajeError')}")
-
-        except requests.exceptions.RequestException as e:
-            _logger.error(f"Error al obtener CUFD en cron: {e}")
+        self.cron_renovar_cufd()
@@ -1,6 +1,7 @@
-from odoo import models, fields, api
-from odoo.exceptions import UserError
+from odoo import models, fields, api, tools
+from odoo.exceptions import ValidationError
 import requests
+from ..tools import sfv_client
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -8,6 +9,7 @@ _logger = logging.getLogger(__name__)
 
 class DireccionApi(models.Model):
     _name = 'l10n_bo_bill.direccion_api'
+    _inherit = 'l10n_bo_bill.cache_mixin'
     _description = 'Direccion API'
 
     name = fields.Char(string='Nombre', required=True)
@@ -24,6 +26,99 @@ class DireccionApi(models.Model):
     activo = fields.Boolean(string='Activo', default=True)
     contingencia = fields.Boolean(string="Contingencia", default=False)
     evento_id = fields.Integer(string="ID del Evento de Contingencia")
+    emision_asincrona = fields.Boolean(
+        string="Emisión Asíncrona",
+        default=True,
+        help="Si está activo, el envío a impuestos deja las facturas en una cola procesada por un cron."
+    )
+    estado_conexion = fields.Selection(
+        [
+            ('ok', 'En línea'),
+            ('caida', 'Sin conexión')
+        ],
+        string="Estado de Conexión",
+        default='ok',
+        readonly=True,
+        help="Último resultado del cron que verifica la comunicación con el SFV."
+    )
+    fecha_estado_conexion = fields.Datetime(string="Cambio de Estado", readonly=True)
+    max_hilos_emision = fields.Integer(
+        string="Emisiones Simultáneas",
+        default=4,
+        help="Cantidad máxima de facturas enviadas en paralelo al emitir en lote."
+    )
+    debug = fields.Boolean(
+        string="Registrar Payloads",
+        default=False,
+        help="Registra en el log el cuerpo completo de cada petición y respuesta al SFV."
+    )
+
+    # Campos expuestos por la configuración en caché
+    _CAMPOS_CONFIG = ['url', 'tipo', 'contingencia', 'evento_id', 'emision_asincrona', 'max_hilos_emision', 'estado_conexion', 'debug']
+    _campos_cache = set(_CAMPOS_CONFIG) | {'activo'}
+
+    @api.constrains('activo')
+    def _check_unica_activa(self):
+        if self.search_count([('activo', '=', True)]) > 1:
+            raise ValidationError("Hay más de una dirección de API activa. Por favor, verifica la configuración.")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # Con la primera API configurada se pueblan los catálogos sin esperar al cron
+        cron = self.env.ref('l10n_bo_bill.ir_cron_actualizar_catalogos', raise_if_not_found=False)
+        if cron and records.filtered('activo'):
+            cron._trigger()
+        return records
+
+    @api.model
+    def _get_config_activa(self):
+        """Configuración de la API activa (o None), leída desde caché."""
+        config = self._get_config_activa_cached()
+        return dict(config) if config else None
 
+    @api.model
+    @tools.ormcache()
+    def _get_config_activa_cached(self):
+        configs = self.sudo().search_read([('activo', '=', True)], self._CAMPOS_CONFIG, limit=1)
+        return configs[0] if configs else None
 
+    def _probar_comunicacion(self):
+        """Consulta /contingencia/verificar-comunicacion y devuelve si hay conexión."""
+        self.ensure_one()
+        url = f"{self.url}/contingencia/verificar-comunicacion"
+        try:
+            response = sfv_client.get(url)
+            if response.status_code != 200:
+                _logger.error("Error al verificar la comunicación. Código: %s. Respuesta: %s", response.status_code, response.text)
+                return False
+            respuesta_json = response.json()
+            _logger.info("Respuesta de verificación de comunicación: %s", respuesta_json)
+            return respuesta_json.get("mensaje", "").lower() == "conexion exitosa"
+        except ValueError:
+            _logger.warning("Respuesta inválida (no JSON) al verificar la comunicación.")
+            return False
+        except requests.exceptions.RequestException as e:
+            _logger.error("Error al conectar con la API de contingencia: %s", e)
+            return False
 
+    @api.model
+    def cron_verificar_comunicacion(self):
+        """Sonda periódica: solo escribe (e invalida la caché) cuando el estado cambia."""
+        config = self._get_config_activa()
+        if not config:
+            return
+        direccion_api = self.browse(config['id'])
+        conectado = direccion_api._probar_comunicacion()
+        if conectado:
+            sfv_client.circuit_breaker.registrar_exito()
+        estado = 'ok' if conectado else 'caida'
+        if estado != config['estado_conexion']:
+            _logger.warning("Estado de conexión SFV: %s -> %s", config['estado_conexion'], estado)
+            direccion_api.write({
+                'estado_conexion': estado,
+                'fecha_estado_conexion': fields.Datetime.now(),
+            })
+            if conectado:
+                # Reanuda las emisiones que quedaron en cola durante la caída
+                self.env.ref('l10n_bo_bill.ir_cron_procesar_cola_emision')._trigger()
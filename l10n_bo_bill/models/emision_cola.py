@@ -0,0 +1,152 @@
+from odoo import models, fields, api
+from datetime import timedelta
+from itertools import zip_longest
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Intentos antes de dejar la fila en error para revisión manual
+MAX_INTENTOS = 5
+
+# Clase de los advisory locks por punto de venta (el segundo entero es el id)
+LOCK_CARRIL = 710301
+
+
+class EmisionCola(models.Model):
+    _name = 'l10n_bo_bill.emision_cola'
+    _description = 'Cola de emisión SFV'
+    _order = 'id desc'
+
+    move_id = fields.Many2one('account.move', string='Factura', required=True, ondelete='cascade', index=True)
+    selling_point_id = fields.Many2one(
+        'selling_point', string='Punto de Venta', related='move_id.l10n_bo_selling_point', store=True, index=True
+    )
+    state = fields.Selection(
+        [
+            ('pendiente', 'Pendiente'),
+            ('hecho', 'Emitida'),
+            ('error', 'Error'),
+        ],
+        string='Estado',
+        default='pendiente',
+        required=True,
+        index=True
+    )
+    intentos = fields.Integer(string='Intentos', default=0)
+    ultimo_error = fields.Text(string='Último Error')
+    fecha_proximo_intento = fields.Datetime(string='Próximo Intento')
+    fecha_emision = fields.Datetime(string='Fecha Emisión')
+
+    @api.model
+    def _encolar(self, moves):
+        """Crea una fila pendiente por factura que no esté ya en cola."""
+        if not moves:
+            return self.browse()
+        self.flush_model(['move_id', 'state'])
+        self.env.cr.execute("""
+            SELECT move_id FROM l10n_bo_bill_emision_cola
+             WHERE state = 'pendiente' AND move_id = ANY(%s)
+        """, (moves.ids,))
+        en_cola = {row[0] for row in self.env.cr.fetchall()}
+        filas = self.create([{'move_id': move.id} for move in moves if move.id not in en_cola])
+        if filas:
+            self.env.ref('l10n_bo_bill.ir_cron_procesar_cola_emision')._trigger()
+        return filas
+
+    @api.model
+    def _carriles_pendientes(self):
+        """Puntos de venta con filas listas (``False`` para las facturas sin punto de venta)."""
+        self.env.cr.execute("""
+            SELECT DISTINCT selling_point_id FROM l10n_bo_bill_emision_cola
+             WHERE state = 'pendiente'
+               AND (fecha_proximo_intento IS NULL OR fecha_proximo_intento <= %s)
+        """, (fields.Datetime.now(),))
+        return [row[0] or False for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _bloquear_carril(self, selling_point_id):
+        """Un solo proceso emite cada punto de venta a la vez; se libera con el commit."""
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", (LOCK_CARRIL, selling_point_id or 0))
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _reclamar(self, limite, selling_point_id=False):
+        """Bloquea hasta ``limite`` filas listas del punto de venta; otros workers las saltan hasta el commit."""
+        self.env.cr.execute("""
+            SELECT id FROM l10n_bo_bill_emision_cola
+             WHERE state = 'pendiente'
+               AND (fecha_proximo_intento IS NULL OR fecha_proximo_intento <= %s)
+               AND selling_point_id IS NOT DISTINCT FROM %s
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (fields.Datetime.now(), selling_point_id or None, limite))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _procesar(self):
+        ya_emitidas = self.filtered(lambda f: f.move_id.l10n_bo_cuf)
+        por_emitir = self - ya_emitidas
+
+        resultados = {}
+        # Emitidas en el SFV en un intento anterior pero sin publicar
+        sin_publicar = ya_emitidas.move_id.filtered(lambda m: m.state == 'draft')
+        if sin_publicar:
+            resultados.update(sin_publicar._publicar_emitidas())
+        if por_emitir:
+            resultados.update(por_emitir.move_id._emitir_lote())
+
+        ahora = fields.Datetime.now()
+        emitidas = self.filtered(lambda f: not resultados.get(f.move_id.id))
+        emitidas.write({'state': 'hecho', 'fecha_emision': ahora, 'ultimo_error': False})
+        for fila in self - emitidas:
+            error = resultados.get(fila.move_id.id)
+            intentos = fila.intentos + 1
+            fila.write({
+                'intentos': intentos,
+                'ultimo_error': error,
+                'state': 'error' if intentos >= MAX_INTENTOS else 'pendiente',
+                'fecha_proximo_intento': ahora + timedelta(minutes=intentos),
+            })
+
+    @api.model
+    def _cron_procesar_cola(self, tamano_lote=50, tiempo_maximo=240):
+        """Vacía la cola por lotes, confirmando cada lote.
+
+        Cada lote toma hasta ``tamano_lote`` filas de cada punto de venta y
+        las intercala, de modo que un punto de venta cargado no retrasa a
+        los demás. Puede ejecutarse desde varios crons o workers a la vez:
+        el advisory lock reparte los puntos de venta entre los procesos y
+        ``SKIP LOCKED`` evita que dos procesos emitan la misma factura.
+        """
+        inicio = time.monotonic()
+        account_move = self.env['account.move']
+        selling_point = self.env['selling_point']
+        while time.monotonic() - inicio < tiempo_maximo:
+            sin_conexion = account_move._sfv_sin_conexion()
+            carriles = []
+            for selling_point_id in self._carriles_pendientes():
+                # Sin contingencia declarada no tiene sentido emitir con el SFV caído
+                if sin_conexion and not selling_point._get_lane(selling_point_id)['contingencia']:
+                    continue
+                if not self._bloquear_carril(selling_point_id):
+                    continue
+                filas = self._reclamar(tamano_lote, selling_point_id)
+                if filas:
+                    carriles.append(filas)
+            if not carriles:
+                if sin_conexion:
+                    _logger.warning("Cola de emisión en espera: SFV sin conexión")
+                break
+            filas = self.browse([fila.id for grupo in zip_longest(*carriles) for fila in grupo if fila])
+            filas._procesar()
+            self.env.cr.commit()
+            _logger.info("Cola de emisión: %s filas procesadas en %s puntos de venta", len(filas), len(carriles))
+
+    def action_reintentar(self):
+        self.filtered(lambda f: f.state == 'error').write({
+            'state': 'pendiente',
+            'intentos': 0,
+            'fecha_proximo_intento': False,
+        })
+        self.env.ref('l10n_bo_bill.ir_cron_procesar_cola_emision')._trigger()
@@ -0,0 +1,99 @@
+from odoo import models, fields
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+from ..tools import sfv_client
+from .account_move import _descargar_pdf_url
+import logging
+import re
+
+_logger = logging.getLogger(__name__)
+
+TAMANO_LOTE_PDF = 50
+
+# Caracteres del nombre del asiento que no van en un nombre de archivo del ZIP
+NO_PERMITIDOS_ZIP = re.compile(r'[^\w.-]+')
+
+
+class ExportacionPdf(models.TransientModel):
+    _name = 'l10n_bo_bill.exportacion_pdf'
+    _description = 'Exportación masiva de PDF de facturas'
+
+    move_ids = fields.Many2many('account.move', string='Facturas')
+    total = fields.Integer(string='Total')
+    procesadas = fields.Integer(string='Procesadas', default=0)
+    errores = fields.Text(string='Errores')
+
+    def _iterar_pdfs(self):
+        """Genera, por lotes, pares (nombre de archivo, adjunto) listos para el ZIP.
+
+        Los PDF que no están en caché se descargan en paralelo; los que el SFV
+        no puede entregar se generan localmente. Cada lote se confirma para
+        que el avance sea visible y los adjuntos se reutilicen aunque la
+        descarga del ZIP se interrumpa.
+        """
+        self.ensure_one()
+        config = self.env['l10n_bo_bill.direccion_api']._get_config_activa()
+        max_hilos = (config or {}).get('max_hilos_emision') or 1
+        directorio = self.env['account.move']._directorio_descarga_pdf()
+        errores = []
+
+        for ids in split_every(TAMANO_LOTE_PDF, self.move_ids.ids):
+            facturas = self.env['account.move'].browse(ids)
+            sin_pdf = facturas.filtered(lambda f: not f._pdf_vigente())
+            locales = sin_pdf.filtered(lambda f: f._representacion_local_requerida())
+            faltantes = [(f, f._url_pdf()) for f in sin_pdf - locales]
+            for (factura, _url), descarga, error in sfv_client.map_concurrent(
+                lambda item: _descargar_pdf_url(item[1], directorio), faltantes, max_hilos
+            ):
+                if error:
+                    _logger.warning("PDF del SFV no disponible para %s (%s); se usa la representación local", factura.name, error)
+                    locales |= factura
+                else:
+                    factura._guardar_pdf_descargado(*descarga)
+            # Las que el SFV no entregó se generan en Odoo, en una sola pasada por formato
+            fallidas = {}
+            try:
+                with self.env.cr.savepoint():
+                    locales._representacion_local()
+            except UserError:
+                # Se repite factura por factura para atribuir el error a cada una
+                for factura in locales:
+                    try:
+                        with self.env.cr.savepoint():
+                            factura._representacion_local()
+                    except UserError as e:
+                        fallidas[factura.id] = str(e)
+
+            # El número se repite entre puntos de venta; el nombre del asiento no
+            lote = []
+            for f in facturas:
+                if f._pdf_vigente(local=True):
+                    lote.append((f"Factura-{NO_PERMITIDOS_ZIP.sub('_', f.name)}-{f.l10n_bo_invoice_number}.pdf", f.sfv_pdf_attachment_id))
+                else:
+                    errores.append(f"{f.name}: {fallidas.get(f.id) or 'sin PDF disponible'} (omitida del ZIP)")
+            anteriores = self.procesadas
+            self.write({
+                'procesadas': anteriores + len(facturas),
+                'errores': "\n".join(errores) or False,
+            })
+            self.env.cr.commit()
+            self._notificar_avance(anteriores)
+            yield lote
+            # Los PDF ya escritos no deben quedar en la caché del entorno
+            self.env.invalidate_all()
+
+    def _notificar_avance(self, anteriores):
+        """Avisa al usuario cada ~10% del total (y al terminar)."""
+        paso = max(TAMANO_LOTE_PDF, self.total // 10)
+        if self.procesadas < self.total and anteriores // paso == self.procesadas // paso:
+            return
+        mensaje = f"PDF exportados: {self.procesadas}/{self.total}"
+        if self.errores:
+            mensaje = f"{mensaje}. Con error: {len(self.errores.splitlines())}"
+        _logger.info(mensaje)
+        self.env['bus.bus']._sendone(self.env.user.partner_id, 'simple_notification', {
+            'title': "Exportación de PDF",
+            'message': mensaje,
+            'type': 'warning' if self.errores else 'info',
+        })
+        self.env.cr.commit()
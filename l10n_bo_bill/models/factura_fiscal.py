@@ -0,0 +1,101 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Tipo SQL de cada columna que se puede guardar con _guardar
+COLUMNAS = {
+    'cuf': 'varchar',
+    'cufd': 'varchar',
+    'numero_factura': 'int',
+    'url': 'varchar',
+    'efact_control_code': 'varchar',
+    'cafc': 'varchar',
+    'dui': 'varchar',
+    'auth_number': 'varchar',
+    'control_code': 'varchar',
+}
+
+
+class FacturaFiscal(models.Model):
+    """Datos fiscales de una factura emitida, fuera de la tabla de asientos.
+
+    Una fila por factura. ``account.move`` expone estas columnas con sus
+    nombres de siempre como campos calculados, de modo que las consultas
+    contables no cargan con su ancho y las búsquedas por CUF o por número
+    usan los índices de esta tabla.
+    """
+    _name = 'l10n_bo_bill.factura_fiscal'
+    _description = 'Datos fiscales de factura SFV'
+    _rec_name = 'cuf'
+
+    move_id = fields.Many2one('account.move', string='Factura', required=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', string='Compañía', required=True)
+    branch_office_id = fields.Many2one('branch_office', string='Sucursal')
+    selling_point_id = fields.Many2one('selling_point', string='Punto de Venta')
+
+    cuf = fields.Char(string='CUF')
+    cufd = fields.Char(string='CUFD')
+    numero_factura = fields.Integer(string='Número de Factura')
+    url = fields.Char(string='URL')
+    efact_control_code = fields.Char(string='Url')
+    cafc = fields.Char(string='CAFC')
+    dui = fields.Char(string='DUI')
+    auth_number = fields.Char(string='Authorization Number')
+    control_code = fields.Char(string='Control Code')
+
+    _sql_constraints = [
+        ('move_uniq', 'unique(move_id)', "La factura ya tiene datos fiscales."),
+    ]
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS l10n_bo_bill_factura_fiscal_cuf_uniq
+                ON l10n_bo_bill_factura_fiscal (cuf)
+             WHERE cuf IS NOT NULL
+        """)
+        # Sin punto de venta la factura es del carril por defecto de su compañía
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS l10n_bo_bill_factura_fiscal_numero_uniq
+                ON l10n_bo_bill_factura_fiscal (
+                    COALESCE(selling_point_id, 0), COALESCE(branch_office_id, 0), company_id, numero_factura
+                )
+             WHERE numero_factura IS NOT NULL
+        """)
+
+    @api.model
+    def _guardar(self, columnas, filas):
+        """Crea o actualiza en una sola consulta los datos fiscales de varias facturas.
+
+        ``filas`` es una lista ``[(move_id, valor, ...)]`` con un valor por
+        cada nombre de ``columnas``. Compañía, sucursal y punto de venta se
+        toman de la factura.
+        """
+        if not filas:
+            return
+        assert all(columna in COLUMNAS for columna in columnas), columnas
+        self.flush_model()
+        self.env['account.move'].flush_model(['company_id', 'l10n_bo_selling_point', 'l10n_bo_branch_office'])
+        lista = ', '.join(columnas)
+        self.env.cr.execute(f"""
+            INSERT INTO l10n_bo_bill_factura_fiscal (
+                move_id, company_id, branch_office_id, selling_point_id, {lista},
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT m.id, m.company_id, m.l10n_bo_branch_office, m.l10n_bo_selling_point,
+                   {', '.join(f'v.{columna}' for columna in columnas)},
+                   %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC'
+              FROM (SELECT unnest(%s::int[]) AS id,
+                           {', '.join(f'unnest(%s::{COLUMNAS[columna]}[]) AS {columna}' for columna in columnas)}) v
+              JOIN account_move m ON m.id = v.id
+            ON CONFLICT (move_id) DO UPDATE
+               SET company_id = EXCLUDED.company_id,
+                   branch_office_id = EXCLUDED.branch_office_id,
+                   selling_point_id = EXCLUDED.selling_point_id,
+                   {', '.join(f'{columna} = EXCLUDED.{columna}' for columna in columnas)},
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, [self.env.uid, self.env.uid] + [[fila[i] for fila in filas] for i in range(len(columnas) + 1)])
+        self.invalidate_model()
+        moves = self.env['account.move'].browse([fila[0] for fila in filas])
+        moves.invalidate_recordset(['sfv_fiscal_ids'] + moves._campos_fiscales(columnas))
@@ -1,13 +1,29 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 import requests
+from ..tools import sfv_client
 import logging
 import json
+import hashlib
 
 _logger = logging.getLogger(__name__)
 
+# Campos que forman parte del ítem enviado al SFV
+CAMPOS_SFV = {'default_code', 'name', 'list_price', 'unit_measure_code', 'product_code'}
+
+
+def _hash_payload(payload):
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def _actualizar_item(api_url, external_id, payload, debug=False):
+    """PUT del ítem; no usa el ORM, puede ejecutarse en un hilo del pool."""
+    response = sfv_client.put(f"{api_url}/item/actualizar-item/{external_id}", json=payload, ref=external_id, debug=debug)
+    response.raise_for_status()
+    return response.json()
+
 class ProductTemplate(models.Model):
-    _inherit = 'product.template'
+    _inherit = ['product.template', 'l10n_bo_bill.sfv_mixin']
     
     # Campos antiguos
 
@@ -15,80 +31,18 @@ class ProductTemplate(models.Model):
     external_id = fields.Char(string='ID externo', readonly=True)
     product_code = fields.Selection(selection='_get_product_codes', string="Código de Producto", required=True, help="Selecciona un código de producto desde la API")
     unit_measure_code = fields.Selection(selection='_get_unit_measures', string="Unidad de Medida", required=True, help="Selecciona una unidad de medida desde la API")
+    sfv_payload_hash = fields.Char(string='Hash del último envío al SFV', readonly=True, copy=False)
 
-    def _get_api_url(self):
-        direccion_apis = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
-
-        if not direccion_apis:
-            raise UserError("No se encontró una configuración de la API activa.")
-        
-        if len(direccion_apis) > 1:
-            raise UserError("Hay más de una dirección de API activa. Por favor, verifica la configuración.")
-
-        return direccion_apis.url
 
     @api.model
     def _get_product_codes(self):
-        api_url = self._get_api_url()
-        url = f"{api_url}/productos"
-
-        # Lista de códigos permitidos como string (para coincidir con la conversión que haces)
-        allowed_codes = {
-            "87290", "45220", "61284", "61285", "61289", "612849", "612859", "612899",
-            "872909", "83141", "83143", "831419", "831439"
-        }
-
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            productos = response.json()
-
-            if not isinstance(productos, list):
-                raise UserError("La API no devolvió una lista válida de productos.")
-
-            seen = set()
-            product_list = []
-            for p in productos:
-                codigo = str(p.get("codigoProducto"))
-                if codigo in allowed_codes and codigo not in seen:
-                    seen.add(codigo)
-                    descripcion = p.get('descripcionProducto', 'Sin descripción')
-                    product_list.append((codigo, f"{codigo} - {descripcion}"))
-
-            return product_list
-
-        except requests.exceptions.RequestException as e:
-            _logger.error(f"Error al obtener productos de la API: {e}")
-            return []
+        # Solo los códigos permitidos, filtrados al sincronizar el catálogo
+        return self.env['l10n_bo_bill.catalogo']._get_selection('producto')
 
 
     @api.model
     def _get_unit_measures(self):
-        api_url = self._get_api_url()
-        url = f"{api_url}/parametro/unidad-medida"
-
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            unidades = response.json()
-
-            if not isinstance(unidades, list):
-                raise UserError("La API no devolvió una lista válida de unidades de medida.")
-
-            seen = set()
-            units_list = []
-            for u in unidades:
-                codigo = str(u.get("codigoClasificador"))
-                if codigo and codigo not in seen:
-                    seen.add(codigo)
-                    descripcion = u.get('descripcion', 'Sin descripción')
-                    units_list.append((codigo, f"{codigo} - {descripcion}"))
-
-            return units_list
-
-        except requests.exceptions.RequestException as e:
-            _logger.error(f"Error al obtener unidades de medida de la API: {e}")
-            return []
+        return self.env['l10n_bo_bill.catalogo']._get_selection('unidad_medida')
 
     @api.model
     def create(self, vals):
@@ -105,19 +59,13 @@ class ProductTemplate(models.Model):
                 "\n- ".join(missing_fields)
             )
 
-        payload = {
-            "codigo": vals.get("default_code"),
-            "descripcion": vals.get("name"),
-            "unidadMedida": int(vals.get("unit_measure_code")),
-            "precioUnitario": float(vals.get("list_price")),
-            "codigoProductoSin": int(vals.get("product_code"))
-        }
+        payload = record._payload_sfv()
 
         api_url = self._get_api_url()
         url = f"{api_url}/item/crear-item"
 
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = sfv_client.post(url, json=payload, ref=record.id, debug=self._get_config_api()['debug'])
             response.raise_for_status()
             response_data = response.json()
 
@@ -125,10 +73,12 @@ class ProductTemplate(models.Model):
                 external_id = response_data["id"]
                 query = """
                     UPDATE product_template
-                    SET external_id = %s
+                    SET external_id = %s,
+                        sfv_payload_hash = %s
                     WHERE id = %s;
                 """
-                self.env.cr.execute(query, (external_id, record.id))
+                self.env.cr.execute(query, (external_id, _hash_payload(payload), record.id))
+                record.invalidate_recordset(['external_id', 'sfv_payload_hash'])
             else:
                 _logger.error("La API no devolvió un ID válido.")
 
@@ -141,32 +91,61 @@ class ProductTemplate(models.Model):
     
     def write(self, vals):
         result = super(ProductTemplate, self).write(vals)
+        # Stock, costos, web...: ningún cambio que afecte al ítem del SFV
+        if CAMPOS_SFV.intersection(vals):
+            self._actualizar_en_api()
+        return result
 
-        for record in self:
-            if not record.external_id:
-                continue  # Si no hay ID externo, no se puede actualizar en la API
-
-            payload = {
-                "codigo": record.default_code,
-                "descripcion": record.name,
-                "unidadMedida": int(record.unit_measure_code),
-                "precioUnitario": float(record.list_price),
-                "codigoProductoSin": int(record.product_code)
-            }
-
-            api_url = record._get_api_url()
-            url = f"{api_url}/item/actualizar-item/{record.external_id}"
-
-            try:
-                _logger.info(f"🔁 Actualizando producto en API con ID {record.external_id}")
-                _logger.info(f"📤 Payload enviado: {json.dumps(payload, indent=2)}")
-                response = requests.put(url, json=payload, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-                _logger.info(f"✅ Producto actualizado en API: {data}")
-            except requests.exceptions.RequestException as e:
-                _logger.error(f"❌ Error al actualizar producto {record.name} en la API: {e}")
-                raise UserError(f"Error al actualizar producto en la API: {e}")
+    def _payload_sfv(self):
+        self.ensure_one()
+        return {
+            "codigo": self.default_code,
+            "descripcion": self.name,
+            "unidadMedida": int(self.unit_measure_code),
+            "precioUnitario": float(self.list_price),
+            "codigoProductoSin": int(self.product_code)
+        }
 
-        return result
+    def _actualizar_en_api(self):
+        """Envía solo los productos cuyo payload cambió desde la última sincronización.
+
+        Las actualizaciones se envían en paralelo; los hashes de los productos
+        actualizados se guardan en una sola consulta.
+        """
+        pendientes = []
+        for record in self.filtered('external_id'):
+            payload = record._payload_sfv()
+            payload_hash = _hash_payload(payload)
+            if payload_hash != record.sfv_payload_hash:
+                pendientes.append((record, record.external_id, payload, payload_hash))
+        if not pendientes:
+            return
 
+        api_url = self._get_api_url()
+        config = self._get_config_api()
+        max_hilos = config['max_hilos_emision']
+        _logger.info(f"🔁 Actualizando {len(pendientes)} productos en la API")
+        resultados = sfv_client.map_concurrent(
+            lambda item: _actualizar_item(api_url, item[1], item[2], config['debug']), pendientes, max_hilos
+        )
+
+        actualizados = []
+        errores = []
+        for (record, _external_id, _payload, payload_hash), _data, error in resultados:
+            if error:
+                _logger.error(f"❌ Error al actualizar producto {record.name} en la API: {error}")
+                errores.append(f"{record.name}: {error}")
+            else:
+                actualizados.append((record.id, payload_hash))
+
+        if actualizados:
+            self.env.cr.execute("""
+                UPDATE product_template t
+                   SET sfv_payload_hash = v.payload_hash
+                  FROM (SELECT unnest(%s::int[]) AS id, unnest(%s::varchar[]) AS payload_hash) v
+                 WHERE t.id = v.id
+            """, ([a[0] for a in actualizados], [a[1] for a in actualizados]))
+            self.invalidate_recordset(['sfv_payload_hash'])
+
+        if errores:
+            raise UserError("Error al actualizar producto en la API:\n" + "\n".join(errores))
@@ -1,12 +1,39 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api
 from odoo.exceptions import UserError
-import requests
+from odoo.tools import split_every
+from ..tools import sfv_client
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Campos que forman parte del payload del cliente en el SFV
+CAMPOS_SFV = {'name', 'tipo_documento_identidad', 'vat', 'complemento', 'codigo_cliente', 'email'}
+TAMANO_LOTE_SYNC = 100
+
+
+def _enviar_cliente(api_url, external_id, payload):
+    """Crea o actualiza un cliente en la API; puede ejecutarse en un hilo del pool."""
+    if external_id:
+        response = sfv_client.put(f"{api_url}/api/clientes/{external_id}", json=payload)
+        response.raise_for_status()
+        return external_id
+
+    response = sfv_client.post(f"{api_url}/api/clientes", json=payload)
+    response.raise_for_status()
+    response_data = response.json()
+    if "id" not in response_data:
+        raise UserError("La API no devolvió un ID válido para el cliente.")
+    return response_data["id"]
+
+
+def _eliminar_cliente(api_url, external_id):
+    response = sfv_client.delete(f"{api_url}/api/clientes/{external_id}")
+    if response.status_code not in (200, 204):
+        raise UserError(f"No se pudo eliminar el cliente en la API: {response.text}")
+
+
 class ResPartner(models.Model):
-    _inherit = 'res.partner'
+    _inherit = ['res.partner', 'l10n_bo_bill.sfv_mixin']
 
     external_id = fields.Char(string='ID externo', readonly=True)
     complemento = fields.Char(string='Complemento')
@@ -17,118 +44,152 @@ class ResPartner(models.Model):
         string="Tipo de Documento",
         help="Selecciona el tipo de documento desde la API"
     )
-
-    def _get_api_url(self):
-        direccion_apis = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)])
-        if not direccion_apis:
-            raise UserError("No se encontró una configuración de la API activa.")
-        if len(direccion_apis) > 1:
-            raise UserError("Hay más de una dirección de API activa. Verifique configuración.")
-        return direccion_apis[0].url
+    sfv_sync_pendiente = fields.Boolean(
+        string='Sincronización SFV Pendiente',
+        default=False,
+        copy=False,
+        readonly=True,
+        index=True
+    )
 
     @api.model
     def _get_tipo_documento_identidad(self):
-        """Obtiene las opciones de tipo de documento desde la API"""
-        api_url = self._get_api_url()
-        url = f"{api_url}/parametro/identidad"
-
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            tipos = response.json()
-
-            if not isinstance(tipos, list):
-                raise UserError("La API no devolvió una lista válida de tipos de documento.")
-
-            return [
-                (str(t.get("codigoClasificador")), f"{t.get('codigoClasificador')} - {t.get('descripcion', 'Sin descripción')}")
-                for t in tipos if t.get("codigoClasificador")
-            ]
-
-        except requests.exceptions.RequestException as e:
-            _logger.error(f"Error al obtener tipos de documento desde la API: {e}")
-            return []
-
-    @api.model
-    def create(self, vals):
-        record = super(ResPartner, self).create(vals)
-
-        payload = {
-            "nombreRazonSocial": vals.get("name"),
-            "codigoTipoDocumentoIdentidad": int(vals.get("tipo_documento_identidad")) if vals.get("tipo_documento_identidad") else None,
-            "numeroDocumento": vals.get("vat"),
-            "complemento": vals.get("complemento", ""),
-            "codigoCliente": vals.get("codigo_cliente"),
-            "email": vals.get("email")
-        }
-
-        api_url = self._get_api_url()
-        url = f"{api_url}/api/clientes"
+        """Obtiene las opciones de tipo de documento desde el catálogo local"""
+        return self.env['l10n_bo_bill.catalogo']._get_selection('identidad')
 
-        try:
-            response = requests.post(url, json=payload, timeout=10)
-            response.raise_for_status()
-            response_data = response.json()
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            vals['sfv_sync_pendiente'] = True
+        records = super(ResPartner, self).create(vals_list)
+        records._programar_sync_sfv()
+        return records
 
-            if "id" in response_data:
-                external_id = response_data["id"]
-                self.env.cr.execute("""
-                    UPDATE res_partner
-                    SET external_id = %s
-                    WHERE id = %s;
-                """, (external_id, record.id))
-            else:
-                _logger.error("La API no devolvió un ID válido para el cliente.")
-
-        except requests.exceptions.RequestException as e:
-            _logger.error(f"Error al enviar cliente a la API: {e}")
-            raise UserError(f"No se pudo sincronizar el cliente con la API: {e}")
-
-        return record
-
-    
     def write(self, vals):
-        result = super(ResPartner, self).write(vals)
-
-        for record in self:
-            if not record.external_id:
-                continue  # Solo actualiza si ya fue sincronizado
-
-            payload = {
-                "nombreRazonSocial": vals.get("name", record.name),
-                "codigoTipoDocumentoIdentidad": int(vals.get("tipo_documento_identidad", record.tipo_documento_identidad)) if vals.get("tipo_documento_identidad", record.tipo_documento_identidad) else None,
-                "numeroDocumento": vals.get("vat", record.vat),
-                "complemento": vals.get("complemento", record.complemento or ""),
-                "codigoCliente": vals.get("codigo_cliente", record.codigo_cliente),
-                "email": vals.get("email", record.email)
-            }
-
-            api_url = self._get_api_url()
-            url = f"{api_url}/api/clientes/{record.external_id}"
-
-            try:
-                response = requests.put(url, json=payload, timeout=10)
-                response.raise_for_status()
-                _logger.info(f"✅ Cliente actualizado en la API: ID {record.external_id}")
-            except requests.exceptions.RequestException as e:
-                _logger.error(f"❌ Error al actualizar cliente en la API: {e}")
-                raise UserError(f"No se pudo actualizar el cliente en la API: {e}")
+        # Solo los campos del payload disparan una sincronización
+        if not CAMPOS_SFV.intersection(vals):
+            return super(ResPartner, self).write(vals)
 
+        result = super(ResPartner, self).write(dict(vals, sfv_sync_pendiente=True))
+        self._programar_sync_sfv()
         return result
 
     def unlink(self):
-        for record in self:
-            if record.external_id:
-                api_url = self._get_api_url()
-                url = f"{api_url}/api/clientes/{record.external_id}"
+        external_ids = [record.external_id for record in self if record.external_id]
+        result = super(ResPartner, self).unlink()
+        if not external_ids:
+            return result
+        config = self._get_config_api()
+        if not config:
+            _logger.warning(f"Sin API activa: clientes no eliminados en el SFV: {external_ids}")
+            return result
+        api_url = config['url']
+        max_hilos = config.get('max_hilos_emision') or 1
+
+        @self.env.cr.postcommit.add
+        def _eliminar_en_api():
+            # El borrado ya se confirmó: un error aquí solo se registra
+            try:
+                for item, _res, error in sfv_client.map_concurrent(
+                    lambda external_id: _eliminar_cliente(api_url, external_id), external_ids, max_hilos
+                ):
+                    if error:
+                        _logger.error(f"❌ Error al eliminar cliente {item} en la API: {error}")
+                    else:
+                        _logger.info(f"🗑️ Cliente eliminado en la API: ID {item}")
+            except Exception:
+                _logger.exception(f"Error al eliminar clientes en la API: {external_ids}")
+        return result
 
+    def _programar_sync_sfv(self):
+        """Agrupa los clientes modificados y los envía una sola vez tras el commit.
+
+        Con el contexto ``sfv_diferir_sync`` (o durante una importación) solo
+        quedan marcados como pendientes para el cron de sincronización, lo
+        mismo que sin API activa o si el envío tras commit falla.
+        """
+        if self.env.context.get('sfv_diferir_sync') or self.env.context.get('import_file'):
+            self.env.ref('l10n_bo_bill.ir_cron_sincronizar_clientes')._trigger()
+            return
+        if not self._get_config_api():
+            return
+
+        pendientes = self.env.cr.postcommit.data.setdefault('l10n_bo_bill.clientes_sync', set())
+        if not pendientes:
+            registry = self.env.registry
+            uid = self.env.uid
+
+            @self.env.cr.postcommit.add
+            def _sincronizar_tras_commit():
+                # La transacción del usuario ya se confirmó: los errores no deben llegar a la petición
                 try:
-                    response = requests.delete(url, timeout=10)
-                    if response.status_code not in (200, 204):
-                        raise UserError(f"No se pudo eliminar el cliente en la API: {response.text}")
-                    _logger.info(f"🗑️ Cliente eliminado en la API: ID {record.external_id}")
-                except requests.exceptions.RequestException as e:
-                    _logger.error(f"❌ Error al eliminar cliente en la API: {e}")
-                    raise UserError(f"No se pudo eliminar el cliente en la API: {e}")
-
-        return super(ResPartner, self).unlink()
+                    with registry.cursor() as cr:
+                        env = api.Environment(cr, uid, {})
+                        env['res.partner'].browse(sorted(pendientes))._sincronizar_sfv()
+                except Exception:
+                    _logger.exception("Error al sincronizar clientes tras el commit; quedan pendientes para el cron")
+        pendientes.update(self.ids)
+
+    def _payload_sfv(self):
+        self.ensure_one()
+        return {
+            "nombreRazonSocial": self.name,
+            "codigoTipoDocumentoIdentidad": int(self.tipo_documento_identidad) if self.tipo_documento_identidad else None,
+            "numeroDocumento": self.vat or None,
+            "complemento": self.complemento or "",
+            "codigoCliente": self.codigo_cliente,
+            "email": self.email or None
+        }
+
+    def _sincronizar_sfv(self):
+        """Envía a la API los clientes pendientes, por lotes y en paralelo.
+
+        Cada lote bloquea sus filas (``SKIP LOCKED``) para que el envío tras
+        commit y el cron no creen dos veces el mismo cliente, y se confirma por
+        separado: un error solo deja pendientes los clientes afectados.
+        """
+        config = self._get_config_api()
+        if not config:
+            _logger.warning("Sin API activa: los clientes quedan pendientes de sincronizar")
+            return
+        api_url = config['url']
+        max_hilos = config.get('max_hilos_emision') or 1
+
+        for ids in split_every(TAMANO_LOTE_SYNC, self.ids):
+            self.env.cr.execute("""
+                SELECT id FROM res_partner
+                 WHERE id IN %s AND sfv_sync_pendiente
+                   FOR UPDATE SKIP LOCKED
+            """, (tuple(ids),))
+            lote = self.browse([row[0] for row in self.env.cr.fetchall()])
+            if not lote:
+                continue
+
+            items = [(p.id, p.external_id, p._payload_sfv()) for p in lote]
+            resultados = sfv_client.map_concurrent(
+                lambda item: _enviar_cliente(api_url, item[1], item[2]), items, max_hilos
+            )
+
+            sincronizados = []
+            for (partner_id, external_id, _payload), nuevo_id, error in resultados:
+                if error:
+                    _logger.error(f"❌ Error al sincronizar cliente {partner_id} con la API: {error}")
+                    continue
+                sincronizados.append((partner_id, str(nuevo_id)))
+
+            if sincronizados:
+                self.env.cr.execute("""
+                    UPDATE res_partner p
+                       SET external_id = v.external_id,
+                           sfv_sync_pendiente = false
+                      FROM (SELECT unnest(%s::int[]) AS id, unnest(%s::varchar[]) AS external_id) v
+                     WHERE p.id = v.id
+                """, ([s[0] for s in sincronizados], [s[1] for s in sincronizados]))
+                lote.invalidate_recordset(['external_id', 'sfv_sync_pendiente'])
+            self.env.cr.commit()
+            _logger.info(f"✅ Clientes sincronizados con la API: {len(sincronizados)}/{len(lote)}")
+
+    @api.model
+    def _cron_sincronizar_clientes(self, limite=5000):
+        """Sincroniza los clientes marcados como pendientes (importaciones, errores previos)."""
+        self.search([('sfv_sync_pendiente', '=', True)], limit=limite)._sincronizar_sfv()
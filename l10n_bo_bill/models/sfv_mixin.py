@@ -0,0 +1,49 @@
+from odoo import models, api
+from odoo.exceptions import UserError
+
+
+class SfvMixin(models.AbstractModel):
+    _name = 'l10n_bo_bill.sfv_mixin'
+    _description = 'Acceso a la configuración de la API SFV'
+
+    @api.model
+    def _get_config_api(self):
+        """Configuración activa (url, tipo, contingencia, evento_id) sin consultar la base."""
+        return self.env['l10n_bo_bill.direccion_api']._get_config_activa()
+
+    @api.model
+    def _get_api_url(self):
+        config = self._get_config_api()
+        if not config:
+            raise UserError("No se encontró una configuración de la API activa.")
+        return config['url']
+
+
+class CacheMixin(models.AbstractModel):
+    """Limpia las ``ormcache`` del registro cuando cambian datos servidos desde caché.
+
+    ``_campos_cache`` limita la limpieza a las escrituras que tocan esos
+    campos; sin definirlo, cualquier escritura la provoca. La limpieza se
+    señala al resto de los workers.
+    """
+    _name = 'l10n_bo_bill.cache_mixin'
+    _description = 'Invalidación de caché de configuración SFV'
+
+    _campos_cache = None
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        if self._campos_cache is None or not self._campos_cache.isdisjoint(vals):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
@@ -0,0 +1,137 @@
+from odoo import models, fields, api, tools
+from odoo.exceptions import UserError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class BranchOffice(models.Model):
+    _name = 'branch_office'
+    _inherit = 'l10n_bo_bill.cache_mixin'
+    _description = 'Sucursal'
+    _order = 'codigo, id'
+
+    # Campos leídos por selling_point._get_lane
+    _campos_cache = {'codigo', 'external_id'}
+
+    name = fields.Char(string='Nombre', required=True)
+    codigo = fields.Integer(
+        string='Código SIN',
+        default=0,
+        required=True,
+        help="Código de la sucursal registrado en el SIN (0 = casa matriz); forma parte del CUF."
+    )
+    external_id = fields.Integer(string='ID Sucursal SFV', default=1, required=True, help="idSucursal en la API del SFV.")
+    company_id = fields.Many2one('res.company', string='Compañía', required=True, default=lambda self: self.env.company)
+    selling_point_ids = fields.One2many('selling_point', 'branch_office_id', string='Puntos de Venta')
+    active = fields.Boolean(string='Activo', default=True)
+
+    _sql_constraints = [
+        ('external_id_company_uniq', 'unique(external_id, company_id)', "Ya existe una sucursal con ese ID del SFV."),
+    ]
+
+
+class SellingPoint(models.Model):
+    _name = 'selling_point'
+    _inherit = 'l10n_bo_bill.cache_mixin'
+    _description = 'Punto de Venta'
+    _order = 'branch_office_id, codigo, id'
+
+    # Campos leídos por _get_lane
+    _campos_cache = {
+        'branch_office_id', 'codigo', 'external_id', 'contingencia', 'evento_id', 'secuencia_contingencia_id',
+    }
+
+    name = fields.Char(string='Nombre', required=True)
+    branch_office_id = fields.Many2one('branch_office', string='Sucursal', required=True, ondelete='restrict', index=True)
+    company_id = fields.Many2one(related='branch_office_id.company_id', store=True)
+    codigo = fields.Integer(
+        string='Código SIN',
+        default=0,
+        required=True,
+        help="Código del punto de venta registrado en el SIN; forma parte del CUF."
+    )
+    external_id = fields.Integer(string='ID Punto de Venta SFV', default=1, required=True, help="idPuntoVenta en la API del SFV.")
+    active = fields.Boolean(string='Activo', default=True)
+
+    # Estado de contingencia propio del punto de venta
+    contingencia = fields.Boolean(string='Contingencia', default=False, readonly=True, copy=False)
+    evento_id = fields.Integer(string='ID del Evento de Contingencia', readonly=True, copy=False)
+    secuencia_contingencia_id = fields.Many2one(
+        'ir.sequence',
+        string='Numeración en Contingencia',
+        readonly=True,
+        copy=False,
+        help="Numeración local sin huecos usada mientras el punto de venta está en contingencia."
+    )
+
+    _sql_constraints = [
+        ('external_id_branch_uniq', 'unique(branch_office_id, external_id)', "Ya existe un punto de venta con ese ID del SFV en la sucursal."),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if not vals.get('secuencia_contingencia_id'):
+                vals['secuencia_contingencia_id'] = self.env['ir.sequence'].sudo().create({
+                    'name': f"Factura en Contingencia - {vals.get('name')}",
+                    'implementation': 'no_gap',
+                    'padding': 0,
+                    'number_increment': 1,
+                    'number_next': 1,
+                }).id
+        return super().create(vals_list)
+
+    @api.model
+    def _get_lane(self, selling_point_id=False):
+        """Datos de emisión del punto de venta, leídos desde caché.
+
+        Sin punto de venta se usa el carril por defecto (sucursal 1, punto
+        de venta 1) con la contingencia registrada en la dirección de API.
+        """
+        if selling_point_id:
+            return dict(self._get_lane_cached(selling_point_id))
+        config = self.env['l10n_bo_bill.direccion_api']._get_config_activa() or {}
+        return {
+            'selling_point_id': False,
+            'id_sucursal': 1,
+            'id_punto_venta': 1,
+            'codigo_sucursal': 0,
+            'codigo_punto_venta': 0,
+            'contingencia': bool(config.get('contingencia')),
+            'evento_id': config.get('evento_id'),
+            'secuencia_id': self.env.ref('l10n_bo_bill.seq_factura_contingencia').id,
+        }
+
+    @api.model
+    @tools.ormcache('selling_point_id')
+    def _get_lane_cached(self, selling_point_id):
+        punto = self.sudo().browse(selling_point_id)
+        return {
+            'selling_point_id': punto.id,
+            'id_sucursal': punto.branch_office_id.external_id,
+            'id_punto_venta': punto.external_id,
+            'codigo_sucursal': punto.branch_office_id.codigo,
+            'codigo_punto_venta': punto.codigo,
+            'contingencia': punto.contingencia,
+            'evento_id': punto.evento_id,
+            'secuencia_id': punto.secuencia_contingencia_id.id,
+        }
+
+    @api.model
+    def _registro_contingencia(self, selling_point_id=False):
+        """Registro donde se guarda la contingencia del carril: el punto de venta o la dirección de API."""
+        if selling_point_id:
+            return self.sudo().browse(selling_point_id)
+        config = self.env['l10n_bo_bill.direccion_api']._get_config_activa()
+        if not config:
+            raise UserError("No se encontró dirección API activa.")
+        return self.env['l10n_bo_bill.direccion_api'].sudo().browse(config['id'])
+
+    @api.model
+    def _carriles_en_contingencia(self):
+        """Ids de punto de venta en contingencia (``False`` para el carril por defecto)."""
+        carriles = self.search([('contingencia', '=', True)]).ids
+        if self._get_lane()['contingencia']:
+            carriles.insert(0, False)
+        return carriles
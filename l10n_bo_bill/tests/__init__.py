@@ -0,0 +1,4 @@
+from . import test_cuf
+from . import test_sfv_client
+from . import test_factura_fiscal
+from . import test_migracion
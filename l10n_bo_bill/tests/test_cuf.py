@@ -0,0 +1,47 @@
+from odoo.tests.common import BaseCase
+
+from odoo.addons.l10n_bo_bill.tools import cuf as cuf_sin
+
+# Datos del ejemplo del algoritmo de generación del CUF del SIN
+EJEMPLO_SIN = {
+    'nit': 123456789,
+    'fecha_hora': '20190113163721231',
+    'sucursal': 0,
+    'modalidad': 1,
+    'tipo_emision': 1,
+    'tipo_factura': 1,
+    'tipo_documento_sector': 1,
+    'numero_factura': 1,
+    'punto_venta': 0,
+}
+CADENA_SIN = '00001234567892019011316372123100001110100000000010000'
+
+
+class TestCuf(BaseCase):
+
+    def test_modulo11_ejemplo_sin(self):
+        # La suma ponderada da 472, resto 10: el SIN lo representa con "1"
+        self.assertEqual(cuf_sin.modulo11(CADENA_SIN), '1')
+
+    def test_modulo11_casos_calculados(self):
+        self.assertEqual(cuf_sin.modulo11('0'), '0')
+        self.assertEqual(cuf_sin.modulo11('1'), '2')
+        # 5 x 2 = 10: resto 10, se representa con "1"
+        self.assertEqual(cuf_sin.modulo11('5'), '1')
+        # Segundo dígito sobre "127": 7x2 + 2x3 + 1x4 = 24, resto 2
+        self.assertEqual(cuf_sin.modulo11('12', num_digitos=2), '72')
+
+    def test_generar_cuf_ejemplo_sin(self):
+        cuf = cuf_sin.generar_cuf('', **EJEMPLO_SIN)
+        self.assertEqual(cuf, '8727F63A15F8976591FDDE5B387C5D015A29E06A1')
+        self.assertEqual(int(cuf, 16), int(CADENA_SIN + '1'))
+
+    def test_generar_cuf_agrega_codigo_control(self):
+        cuf = cuf_sin.generar_cuf('A19E23EF34124CD', **EJEMPLO_SIN)
+        self.assertEqual(cuf, '8727F63A15F8976591FDDE5B387C5D015A29E06A1A19E23EF34124CD')
+
+    def test_generar_cuf_rechaza_campos_invalidos(self):
+        with self.assertRaises(ValueError):
+            cuf_sin.generar_cuf('', **dict(EJEMPLO_SIN, numero_factura=12345678901))
+        with self.assertRaises(ValueError):
+            cuf_sin.generar_cuf('', **dict(EJEMPLO_SIN, nit='12-34'))
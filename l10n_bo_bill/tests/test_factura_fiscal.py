@@ -0,0 +1,58 @@
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+
+@tagged('post_install', '-at_install')
+class TestFacturaFiscal(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Facturas sin líneas: crear productos llama a la API del SFV
+        cls.diario = cls.env['account.journal'].create({'name': 'Ventas SFV', 'code': 'TSFV', 'type': 'sale'})
+        cls.cliente = cls.env['res.partner'].create({'name': 'Cliente SFV'})
+        cls.factura, cls.otra = cls.env['account.move'].create([
+            {'move_type': 'out_invoice', 'journal_id': cls.diario.id, 'partner_id': cls.cliente.id}
+            for _i in range(2)
+        ])
+        cls.Fiscal = cls.env['l10n_bo_bill.factura_fiscal']
+
+    def _filas(self, moves):
+        return self.Fiscal.search([('move_id', 'in', moves.ids)])
+
+    def test_guardar_crea_la_fila(self):
+        self.Fiscal._guardar(('cuf', 'numero_factura'), [(self.factura.id, 'CUF-1', 15)])
+        fila = self._filas(self.factura)
+        self.assertEqual(len(fila), 1)
+        self.assertEqual(fila.company_id, self.factura.company_id)
+        self.assertEqual(self.factura.l10n_bo_cuf, 'CUF-1')
+        self.assertEqual(self.factura.l10n_bo_invoice_number, '15')
+
+    def test_guardar_actualiza_solo_las_columnas_dadas(self):
+        self.Fiscal._guardar(('cuf', 'numero_factura'), [(self.factura.id, 'CUF-1', 15)])
+        self.Fiscal._guardar(('url',), [(self.factura.id, 'https://sfv/consulta?cuf=CUF-1')])
+        fila = self._filas(self.factura)
+        self.assertEqual(len(fila), 1)
+        self.assertRecordValues(fila, [{'cuf': 'CUF-1', 'numero_factura': 15, 'url': 'https://sfv/consulta?cuf=CUF-1'}])
+        self.assertEqual(self.factura.url, 'https://sfv/consulta?cuf=CUF-1')
+
+    def test_guardar_varias_facturas(self):
+        self.Fiscal._guardar(('cuf', 'numero_factura'), [
+            (self.factura.id, 'CUF-1', 15),
+            (self.otra.id, 'CUF-2', 16),
+        ])
+        self.assertEqual(len(self._filas(self.factura | self.otra)), 2)
+        self.assertEqual(self.otra.l10n_bo_cuf, 'CUF-2')
+        self.assertEqual(self.otra.l10n_bo_invoice_number, '16')
+
+    def test_busquedas_por_cuf_y_numero(self):
+        self.Fiscal._guardar(('cuf', 'numero_factura'), [
+            (self.factura.id, 'CUF-ABC-1', 15),
+            (self.otra.id, 'CUF-XYZ-2', 16),
+        ])
+        Move = self.env['account.move']
+        facturas = self.factura | self.otra
+        self.assertEqual(Move.search([('id', 'in', facturas.ids), ('l10n_bo_cuf', '=', 'CUF-ABC-1')]), self.factura)
+        self.assertEqual(Move.search([('id', 'in', facturas.ids), ('l10n_bo_cuf', 'ilike', 'abc')]), self.factura)
+        self.assertEqual(Move.search([('id', 'in', facturas.ids), ('l10n_bo_invoice_number', '=', '15')]), self.factura)
+        self.assertFalse(Move.search([('id', 'in', facturas.ids), ('l10n_bo_invoice_number', '=', 'abc')]))
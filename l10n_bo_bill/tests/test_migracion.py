@@ -0,0 +1,64 @@
+import importlib.util
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+from odoo.tools.misc import file_path
+from odoo.tools.sql import column_exists
+
+
+MIGRACION = 'l10n_bo_bill.migracion'
+
+
+def _cargar_migracion(ruta):
+    spec = importlib.util.spec_from_file_location(MIGRACION, file_path(ruta))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@tagged('post_install', '-at_install')
+class TestMigracion11(TransactionCase):
+    """Traslado de los datos fiscales de ``account_move`` (migración a 1.1)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.migracion = _cargar_migracion('l10n_bo_bill/migrations/1.1/post-migrate.py')
+        diario = cls.env['account.journal'].create({'name': 'Ventas SFV', 'code': 'TSFV', 'type': 'sale'})
+        cliente = cls.env['res.partner'].create({'name': 'Cliente SFV'})
+        cls.original, cls.duplicada, cls.tercera = cls.env['account.move'].create([
+            {'move_type': 'out_invoice', 'journal_id': diario.id, 'partner_id': cliente.id}
+            for _i in range(3)
+        ])
+
+    def _columnas_antiguas(self, valores):
+        self.env.flush_all()
+        cr = self.env.cr
+        for columna in self.migracion.COLUMNAS_ANTIGUAS:
+            cr.execute(f'ALTER TABLE account_move ADD COLUMN "{columna}" varchar')
+        for move, vals in valores.items():
+            asignaciones = ', '.join(f'"{columna}" = %s' for columna in vals)
+            cr.execute(f'UPDATE account_move SET {asignaciones} WHERE id = %s', [*vals.values(), move.id])
+
+    def test_conserva_cuf_y_numero_solo_en_la_original(self):
+        # La duplicada copió el CUF y el número de la original
+        self._columnas_antiguas({
+            self.original: {'l10n_bo_cuf': 'CUF-1', 'l10n_bo_invoice_number': '15', 'cafc': '123'},
+            self.duplicada: {'l10n_bo_cuf': 'CUF-1', 'l10n_bo_invoice_number': '15', 'cafc': '123'},
+            self.tercera: {'l10n_bo_cuf': 'CUF-2', 'l10n_bo_invoice_number': 'S/N'},
+        })
+        with self.assertLogs(MIGRACION, 'WARNING'):
+            self.migracion.migrate(self.env.cr, '1.0')
+        self.env.invalidate_all()
+
+        self.assertRecordValues(self.original, [{'l10n_bo_cuf': 'CUF-1', 'l10n_bo_invoice_number': '15', 'cafc': False}])
+        self.assertRecordValues(self.duplicada, [{'l10n_bo_cuf': False, 'l10n_bo_invoice_number': False, 'cafc': False}])
+        self.assertRecordValues(self.tercera, [{'l10n_bo_cuf': 'CUF-2', 'l10n_bo_invoice_number': False}])
+        for columna in self.migracion.COLUMNAS_ANTIGUAS:
+            self.assertFalse(column_exists(self.env.cr, 'account_move', columna), columna)
+
+    def test_sin_columnas_antiguas_no_hace_nada(self):
+        self.migracion.migrate(self.env.cr, '1.0')
+        self.assertFalse(self.env['l10n_bo_bill.factura_fiscal'].search([
+            ('move_id', 'in', (self.original | self.duplicada | self.tercera).ids),
+        ]))
@@ -0,0 +1,176 @@
+import threading
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.l10n_bo_bill.benchmarks import mock_sfv
+from odoo.addons.l10n_bo_bill.tools import sfv_client
+
+LOGGER = 'odoo.addons.l10n_bo_bill.tools.sfv_client'
+EMITIR = '/factura/emitir-computarizada'
+
+
+class Reloj:
+    """Sustituto de ``time`` para controlar ``monotonic`` desde el test."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self):
+        return self.ahora
+
+
+def _permitir_en_otro_hilo(breaker):
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(breaker.permitir()))
+    hilo.start()
+    hilo.join()
+    return resultado[0]
+
+
+class TestCircuitBreaker(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reloj = Reloj()
+        self.startPatcher(patch.object(sfv_client, 'time', self.reloj))
+        self.breaker = sfv_client.CircuitBreaker(umbral=2, espera=30)
+
+    def _abrir(self):
+        with self.assertLogs(LOGGER, 'WARNING'):
+            self.breaker.registrar_fallo()
+            self.breaker.registrar_fallo()
+
+    def test_se_abre_al_llegar_al_umbral(self):
+        self.breaker.registrar_fallo()
+        self.assertFalse(self.breaker.abierto)
+        self.assertTrue(self.breaker.permitir())
+        self._abrir()
+        self.assertTrue(self.breaker.abierto)
+        self.assertFalse(self.breaker.permitir())
+
+    def test_exito_reinicia_el_contador(self):
+        self.breaker.registrar_fallo()
+        self.breaker.registrar_exito()
+        self.breaker.registrar_fallo()
+        self.assertFalse(self.breaker.abierto)
+        self.assertTrue(self.breaker.permitir())
+
+    def test_semiabierto_deja_pasar_un_solo_hilo(self):
+        self._abrir()
+        self.reloj.ahora += 30
+        self.assertFalse(self.breaker.abierto)
+        self.assertTrue(self.breaker.permitir())
+        # El mismo hilo puede seguir con su prueba, los demás esperan
+        self.assertTrue(self.breaker.permitir())
+        self.assertFalse(_permitir_en_otro_hilo(self.breaker))
+
+    def test_prueba_exitosa_cierra_el_circuito(self):
+        self._abrir()
+        self.reloj.ahora += 30
+        self.assertTrue(self.breaker.permitir())
+        self.breaker.registrar_exito()
+        self.assertTrue(_permitir_en_otro_hilo(self.breaker))
+        # Cerrado de nuevo: hace falta otra vez el umbral completo para abrirlo
+        self.breaker.registrar_fallo()
+        self.assertTrue(self.breaker.permitir())
+
+    def test_prueba_fallida_reabre_el_circuito(self):
+        self._abrir()
+        self.reloj.ahora += 30
+        self.assertTrue(self.breaker.permitir())
+        with self.assertLogs(LOGGER, 'WARNING'):
+            self.breaker.registrar_fallo()
+        self.assertTrue(self.breaker.abierto)
+        self.assertFalse(self.breaker.permitir())
+        self.reloj.ahora += 29
+        self.assertFalse(self.breaker.permitir())
+        self.reloj.ahora += 1
+        self.assertTrue(self.breaker.permitir())
+
+    def test_prueba_sin_resultado_caduca(self):
+        self._abrir()
+        self.reloj.ahora += 30
+        self.assertTrue(self.breaker.permitir())
+        self.reloj.ahora += 29
+        self.assertFalse(_permitir_en_otro_hilo(self.breaker))
+        self.reloj.ahora += 1
+        self.assertTrue(_permitir_en_otro_hilo(self.breaker))
+
+    def test_fallos_con_el_circuito_abierto_no_alargan_la_espera(self):
+        self._abrir()
+        self.reloj.ahora += 20
+        self.breaker.registrar_fallo()
+        self.reloj.ahora += 10
+        self.assertTrue(self.breaker.permitir())
+
+
+class TestReintentosIdempotentes(BaseCase):
+    """Bucle de reintentos de ``sfv_client.request`` contra ``benchmarks/mock_sfv.py``."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor, cls.url = mock_sfv.iniciar_en_hilo(port=0)
+        cls.addClassCleanup(cls.servidor.server_close)
+        cls.addClassCleanup(cls.servidor.shutdown)
+        cls.estado = cls.servidor.RequestHandlerClass.estado
+
+    def setUp(self):
+        super().setUp()
+        with self.estado.lock:
+            self.estado.config['fallar_siguientes'] = 0
+        self.breaker = sfv_client.CircuitBreaker()
+        self.startPatcher(patch.object(sfv_client, 'circuit_breaker', self.breaker))
+        self.startPatcher(patch.object(sfv_client, '_espera_reintento', return_value=0))
+
+    def _fallar_siguientes(self, cantidad):
+        with self.estado.lock:
+            self.estado.config['fallar_siguientes'] = cantidad
+
+    def _restantes(self):
+        # Se descuenta bajo el lock antes de responder: cuenta los 503 ya servidos
+        with self.estado.lock:
+            return self.estado.config['fallar_siguientes']
+
+    def _emitir(self, **kwargs):
+        return sfv_client.post(self.url + EMITIR, json={'idSucursal': 1, 'idPuntoVenta': 1}, **kwargs)
+
+    def test_reintenta_hasta_obtener_respuesta(self):
+        self._fallar_siguientes(2)
+        with self.assertLogs(LOGGER, 'WARNING'):
+            response = self._emitir(idempotency_key='factura-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._restantes(), 0)
+
+    def test_misma_clave_devuelve_la_misma_factura(self):
+        primera = self._emitir(idempotency_key='factura-2').json()
+        segunda = self._emitir(idempotency_key='factura-2').json()
+        self.assertEqual(primera['cuf'], segunda['cuf'])
+        self.assertEqual(primera['numeroFactura'], segunda['numeroFactura'])
+        otra = self._emitir(idempotency_key='factura-3').json()
+        self.assertNotEqual(otra['cuf'], primera['cuf'])
+
+    def test_sin_clave_no_reintenta(self):
+        self._fallar_siguientes(2)
+        response = self._emitir()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self._restantes(), 1)
+
+    def test_agota_los_reintentos(self):
+        total = sfv_client.REINTENTOS_IDEMPOTENTES + 1
+        self._fallar_siguientes(total + 1)
+        with self.assertLogs(LOGGER, 'WARNING'):
+            response = self._emitir(idempotency_key='factura-4')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self._restantes(), 1)
+
+    def test_circuito_abierto_corta_los_reintentos(self):
+        self.breaker = sfv_client.CircuitBreaker(umbral=2)
+        self.startPatcher(patch.object(sfv_client, 'circuit_breaker', self.breaker))
+        self._fallar_siguientes(5)
+        with self.assertLogs(LOGGER, 'WARNING'):
+            response = self._emitir(idempotency_key='factura-5')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self._restantes(), 3)
+        self.assertTrue(self.breaker.abierto)
@@ -0,0 +1,3 @@
+from . import sfv_metrics
+from . import sfv_client
+from . import cuf
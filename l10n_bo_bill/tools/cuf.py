@@ -0,0 +1,65 @@
+"""Generación local del CUF (Código Único de Factura) según el algoritmo del SIN.
+
+Los campos se rellenan con ceros a su longitud fija y se concatenan; a la
+cadena se le agrega el dígito verificador Módulo 11, se convierte a Base16 y
+finalmente se le concatena el código de control del CUFD vigente.
+"""
+
+# Longitud de cada campo del CUF, en orden de concatenación
+LONGITUDES = (
+    ('nit', 13),
+    ('fecha_hora', 17),
+    ('sucursal', 4),
+    ('modalidad', 1),
+    ('tipo_emision', 1),
+    ('tipo_factura', 1),
+    ('tipo_documento_sector', 2),
+    ('numero_factura', 10),
+    ('punto_venta', 4),
+)
+
+MODALIDAD_ELECTRONICA = 1
+MODALIDAD_COMPUTARIZADA = 2
+TIPO_EMISION_FUERA_DE_LINEA = 2
+TIPO_FACTURA_CREDITO_FISCAL = 1
+DOCUMENTO_SECTOR_COMPRA_VENTA = 1
+
+
+def modulo11(cadena, num_digitos=1, limite_multiplicador=9, x10=False):
+    """Dígito(s) verificador(es) Módulo 11 tal como los calcula el SIN."""
+    for _n in range(num_digitos):
+        suma = 0
+        multiplicador = 2
+        for caracter in reversed(cadena):
+            suma += multiplicador * int(caracter)
+            multiplicador += 1
+            if multiplicador > limite_multiplicador:
+                multiplicador = 2
+        digito = ((suma * 10) % 11) % 10 if x10 else suma % 11
+        if digito == 10:
+            cadena += "1"
+        elif digito == 11:
+            cadena += "0"
+        else:
+            cadena += str(digito)
+    return cadena[-num_digitos:]
+
+
+def base16(cadena_numerica):
+    return format(int(cadena_numerica), 'X')
+
+
+def generar_cuf(codigo_control, **campos):
+    """Calcula el CUF; ``campos`` recibe los nombres de ``LONGITUDES``.
+
+    ``fecha_hora`` debe venir en formato ``yyyyMMddHHmmssSSS`` (hora de Bolivia).
+    """
+    partes = []
+    for nombre, longitud in LONGITUDES:
+        valor = str(campos[nombre])
+        if not valor.isdigit() or len(valor) > longitud:
+            raise ValueError(f"Valor inválido para {nombre} del CUF: {valor!r}")
+        partes.append(valor.zfill(longitud))
+    cadena = "".join(partes)
+    cadena += modulo11(cadena)
+    return base16(cadena) + (codigo_control or "")
@@ -0,0 +1,340 @@
+"""Cliente HTTP compartido para las llamadas a la API del SFV.
+
+Cada hilo de cada worker reutiliza una ``requests.Session`` con pool de
+conexiones keep-alive, de modo que las operaciones masivas no pagan el
+establecimiento de TCP/TLS en cada factura, cliente o producto.
+
+Cada llamada deja una línea compacta en el log (método, endpoint,
+referencia, estado, latencia y tamaños). Los cuerpos completos solo se
+registran con ``debug=True``, con el logger en nivel DEBUG o para una
+muestra de las llamadas (opción ``sfv_log_sample_rate`` del servidor,
+entre 0 y 1).
+"""
+import os
+import json
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from odoo.tools import config
+
+from . import sfv_metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_logger = logging.getLogger(__name__)
+
+POOL_MAXSIZE = 16
+
+# Timeouts por defecto (conexión, lectura) según el endpoint
+CONNECT_TIMEOUT = 5
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, 10)
+TIMEOUTS = (
+    ('/factura/emitir-computarizada', (CONNECT_TIMEOUT, 15)),
+    ('/factura/emitir-paquete', (CONNECT_TIMEOUT, 60)),
+    ('/contingencia/registrar-fin-evento', (CONNECT_TIMEOUT, 60)),
+    ('/contingencia/verificar-comunicacion', (CONNECT_TIMEOUT, 5)),
+    ('/pdf/download', (CONNECT_TIMEOUT, 30)),
+)
+
+# Solo se reintentan métodos idempotentes; un POST de emisión repetido
+# podría generar un documento fiscal duplicado.
+RETRY = Retry(
+    total=2,
+    connect=2,
+    read=1,
+    status=2,
+    backoff_factor=0.3,
+    status_forcelist=(502, 503, 504),
+    allowed_methods=frozenset({'GET', 'PUT', 'DELETE', 'HEAD'}),
+    raise_on_status=False,
+)
+
+# Máximo de caracteres de cada cuerpo volcado al log
+MAX_VOLCADO = 20000
+
+# Reintentos de las llamadas con clave de idempotencia (POST de emisión,
+# anulación y reversión): el SFV descarta los duplicados con la misma clave.
+REINTENTOS_IDEMPOTENTES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAXIMO = 8
+STATUS_REINTENTABLES = frozenset({429, 502, 503, 504})
+
+
+class CircuitBreaker:
+    """Corta las llamadas tras ``umbral`` fallos de conexión consecutivos.
+
+    Abierto, ``permitir`` devuelve False durante ``espera`` segundos. Luego
+    queda semiabierto: solo el hilo que toma la llamada de prueba pasa,
+    hasta que esa llamada registra un éxito (se cierra) o un fallo (vuelve
+    a abrirse). Una prueba que no informa su resultado en ``espera``
+    segundos puede tomarla otro hilo.
+    """
+
+    def __init__(self, umbral=5, espera=30):
+        self.umbral = umbral
+        self.espera = espera
+        self._fallos = 0
+        self._abierto_desde = None
+        # (hilo, inicio) de la llamada de prueba en curso
+        self._prueba = None
+        self._lock = threading.Lock()
+
+    @property
+    def abierto(self):
+        with self._lock:
+            return self._abierto_desde is not None and time.monotonic() - self._abierto_desde < self.espera
+
+    def permitir(self):
+        with self._lock:
+            if self._abierto_desde is None:
+                return True
+            ahora = time.monotonic()
+            if ahora - self._abierto_desde < self.espera:
+                return False
+            hilo = threading.get_ident()
+            if self._prueba and self._prueba[0] == hilo:
+                return True
+            if self._prueba and ahora - self._prueba[1] < self.espera:
+                return False
+            _logger.info("Circuito SFV semiabierto: se deja pasar una llamada de prueba")
+            self._prueba = (hilo, ahora)
+            return True
+
+    def registrar_exito(self):
+        with self._lock:
+            if self._abierto_desde is not None:
+                _logger.info("Circuito SFV cerrado")
+            self._fallos = 0
+            self._abierto_desde = None
+            self._prueba = None
+
+    def registrar_fallo(self):
+        with self._lock:
+            if self._prueba is not None:
+                # Falló la llamada de prueba: otro período abierto
+                _logger.warning("Circuito SFV abierto de nuevo: falló la llamada de prueba")
+                self._abierto_desde = time.monotonic()
+                self._prueba = None
+            elif self._abierto_desde is None:
+                self._fallos += 1
+                if self._fallos >= self.umbral:
+                    _logger.warning("Circuito SFV abierto tras %s fallos consecutivos", self._fallos)
+                    self._abierto_desde = time.monotonic()
+                    self._fallos = 0
+
+
+# Estado del circuito en este worker, alimentado por las emisiones reales
+circuit_breaker = CircuitBreaker()
+
+_local = threading.local()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _new_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=RETRY)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip, deflate',
+    })
+    return session
+
+
+def get_session():
+    """Sesión del hilo actual; se recrea tras un fork del worker."""
+    session = getattr(_local, 'session', None)
+    if session is None or _local.pid != os.getpid():
+        session = _local.session = _new_session()
+        _local.pid = os.getpid()
+    return session
+
+
+def default_timeout(url):
+    for path, timeout in TIMEOUTS:
+        if path in url:
+            return timeout
+    return DEFAULT_TIMEOUT
+
+
+def _muestreado():
+    tasa = float(config.get('sfv_log_sample_rate') or 0)
+    return tasa > 0 and random.random() < tasa
+
+
+def _espera_reintento(intento, response=None):
+    """Backoff exponencial con jitter completo; respeta ``Retry-After`` si viene en segundos."""
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        return min(int(retry_after), BACKOFF_MAXIMO)
+    return random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** intento))
+
+
+def dumps(datos):
+    """JSON compacto en bytes; usa ``orjson`` si está instalado."""
+    if orjson is not None:
+        return orjson.dumps(datos)
+    return json.dumps(datos, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def request(method, url, timeout=None, ref=None, debug=False, idempotency_key=None, **kwargs):
+    """Llamada a la API con una línea de log por petición.
+
+    ``ref`` identifica el documento en el log (id de factura, de ítem...);
+    ``debug`` fuerza el volcado de los cuerpos de petición y respuesta.
+    Con ``idempotency_key`` la clave viaja en la cabecera ``Idempotency-Key``
+    y los errores de red o de disponibilidad se reintentan con backoff,
+    mientras el circuito siga cerrado; cada intento fallido cuenta para el
+    circuito.
+    """
+    if kwargs.get('json') is not None:
+        # Serialización compacta hecha una sola vez; su tamaño va al log
+        kwargs['data'] = dumps(kwargs.pop('json'))
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Content-Type': 'application/json'})
+    else:
+        kwargs.pop('json', None)
+    if timeout is None:
+        timeout = default_timeout(url)
+
+    if idempotency_key is None:
+        return _request(method, url, timeout, ref, debug, **kwargs)
+
+    kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Idempotency-Key': idempotency_key})
+    intento = 0
+    while True:
+        try:
+            response = _request(method, url, timeout, ref, debug, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            # El último intento lo registra quien llama, junto con el resultado
+            if intento >= REINTENTOS_IDEMPOTENTES:
+                raise
+            circuit_breaker.registrar_fallo()
+            if not circuit_breaker.permitir():
+                raise
+            response = None
+        else:
+            if response.status_code not in STATUS_REINTENTABLES or intento >= REINTENTOS_IDEMPOTENTES:
+                return response
+            if response.status_code >= 500:
+                circuit_breaker.registrar_fallo()
+            if not circuit_breaker.permitir():
+                return response
+        espera = _espera_reintento(intento, response)
+        intento += 1
+        _logger.warning("sfv %s %s ref=%s reintento %s en %.1fs", method, urlsplit(url).path, ref, intento, espera)
+        time.sleep(espera)
+
+
+def _request(method, url, timeout, ref, debug, **kwargs):
+    cuerpo = kwargs.get('data')
+    tamano_peticion = len(cuerpo) if isinstance(cuerpo, (bytes, str)) else 0
+    endpoint = urlsplit(url).path
+
+    inicio = time.monotonic()
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+    except requests.exceptions.RequestException as e:
+        segundos = time.monotonic() - inicio
+        sfv_metrics.observar(method, endpoint, type(e).__name__, segundos)
+        _logger.warning(
+            "sfv %s %s ref=%s error=%s ms=%d req=%dB",
+            method, endpoint, ref, type(e).__name__, segundos * 1000, tamano_peticion,
+        )
+        raise
+    segundos = time.monotonic() - inicio
+    milisegundos = segundos * 1000
+    sfv_metrics.observar(method, endpoint, response.status_code, segundos)
+
+    # Con stream=True leer el contenido consumiría la respuesta
+    if kwargs.get('stream'):
+        tamano_respuesta = response.headers.get('Content-Length', '?')
+    else:
+        tamano_respuesta = len(response.content)
+    _logger.info(
+        "sfv %s %s ref=%s status=%s ms=%d req=%dB resp=%sB",
+        method, endpoint, ref, response.status_code, milisegundos, tamano_peticion, tamano_respuesta,
+    )
+
+    if debug or _logger.isEnabledFor(logging.DEBUG) or _muestreado():
+        if isinstance(cuerpo, bytes):
+            cuerpo = cuerpo.decode(errors='replace')
+        tipo = response.headers.get('Content-Type', '')
+        if kwargs.get('stream') or not ('json' in tipo or tipo.startswith('text/')):
+            volcado = f"<{tipo or 'binario'}>"
+        else:
+            volcado = response.text[:MAX_VOLCADO]
+        _logger.info(
+            "sfv %s %s ref=%s request=%s response=%s",
+            method, endpoint, ref, (cuerpo or '')[:MAX_VOLCADO], volcado,
+        )
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
+
+
+def _get_executor():
+    """Pool de hilos del worker; sus hilos conservan sus sesiones entre lotes."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=POOL_MAXSIZE, thread_name_prefix='sfv')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def map_concurrent(func, items, max_workers):
+    """Ejecuta ``func(item)`` con como máximo ``max_workers`` llamadas simultáneas.
+
+    Devuelve una lista ``[(item, resultado, excepcion)]`` en el orden de
+    ``items``. ``func`` se ejecuta fuera del hilo de la petición, por lo que
+    no debe usar el ORM ni el cursor.
+    """
+    items = list(items)
+    max_workers = max(1, min(max_workers or 1, POOL_MAXSIZE, len(items) or 1))
+
+    def _call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    if max_workers == 1:
+        return [_call(item) for item in items]
+
+    semaforo = threading.BoundedSemaphore(max_workers)
+
+    def _limitado(item):
+        with semaforo:
+            return _call(item)
+
+    executor = _get_executor()
+    futures = [executor.submit(_limitado, item) for item in items]
+    return [future.result() for future in futures]
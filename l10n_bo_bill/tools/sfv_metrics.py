@@ -0,0 +1,182 @@
+"""Métricas de las llamadas a la API del SFV en formato de exposición de Prometheus.
+
+Cada worker acumula en memoria contadores e histogramas de latencia por
+endpoint y los vuelca cada pocos segundos a un archivo propio (``<pid>.json``)
+en el directorio ``sfv_metrics_dir`` del servidor. Al recolectar se suman
+los archivos de todos los workers, de modo que el scrape ve el total sin
+importar qué worker atiende la petición.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import logging
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Límites (segundos) de los buckets del histograma de latencia
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Segundos entre volcados del estado del worker a su archivo
+INTERVALO_VOLCADO = 5
+# Los archivos de workers sin actividad en este plazo se descartan
+RETENCION = 24 * 3600
+
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+
+_lock = threading.Lock()
+_contadores = {}
+_histogramas = {}
+_ultimo_volcado = 0.0
+_pid = os.getpid()
+
+
+def normalizar_endpoint(path):
+    """Reemplaza los ids numéricos de la ruta para acotar las series."""
+    return _ID_RE.sub('/{id}', path)
+
+
+def _directorio():
+    return config.get('sfv_metrics_dir') or os.path.join(tempfile.gettempdir(), 'odoo_sfv_metrics')
+
+
+def _reiniciar_si_fork():
+    """Un worker recién creado no hereda los contadores del proceso padre."""
+    global _pid, _ultimo_volcado
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _contadores.clear()
+        _histogramas.clear()
+        _ultimo_volcado = 0.0
+
+
+def observar(method, path, status, segundos):
+    """Registra una llamada: ``status`` es el código HTTP o el nombre de la excepción."""
+    global _ultimo_volcado
+    endpoint = normalizar_endpoint(path)
+    with _lock:
+        _reiniciar_si_fork()
+        clave = (method, endpoint, str(status))
+        _contadores[clave] = _contadores.get(clave, 0) + 1
+
+        histograma = _histogramas.setdefault((method, endpoint), [[0] * len(BUCKETS), 0.0, 0])
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                histograma[0][i] += 1
+                break
+        histograma[1] += segundos
+        histograma[2] += 1
+
+        ahora = time.monotonic()
+        volcar = ahora - _ultimo_volcado >= INTERVALO_VOLCADO
+        if volcar:
+            _ultimo_volcado = ahora
+    if volcar:
+        _volcar()
+
+
+def _volcar():
+    with _lock:
+        _reiniciar_si_fork()
+        estado = {
+            'contadores': [list(clave) + [n] for clave, n in _contadores.items()],
+            'histogramas': [
+                [method, endpoint, list(buckets), suma, total]
+                for (method, endpoint), (buckets, suma, total) in _histogramas.items()
+            ],
+        }
+    if not estado['contadores']:
+        return
+    directorio = _directorio()
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        destino = os.path.join(directorio, f'{os.getpid()}.json')
+        temporal = f'{destino}.tmp'
+        with open(temporal, 'w') as archivo:
+            json.dump(estado, archivo)
+        os.replace(temporal, destino)
+    except OSError as e:
+        _logger.warning("No se pudieron guardar las métricas del SFV en %s: %s", directorio, e)
+
+
+def recolectar():
+    """Suma el estado volcado por todos los workers."""
+    _volcar()
+    contadores = {}
+    histogramas = {}
+    directorio = _directorio()
+    try:
+        nombres = os.listdir(directorio)
+    except OSError:
+        nombres = []
+    limite = time.time() - RETENCION
+    for nombre in nombres:
+        if not nombre.endswith('.json'):
+            continue
+        ruta = os.path.join(directorio, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.unlink(ruta)
+                continue
+            with open(ruta) as archivo:
+                estado = json.load(archivo)
+        except (OSError, ValueError):
+            continue
+        for method, endpoint, status, n in estado['contadores']:
+            clave = (method, endpoint, status)
+            contadores[clave] = contadores.get(clave, 0) + n
+        for method, endpoint, buckets, suma, total in estado['histogramas']:
+            acumulado = histogramas.setdefault((method, endpoint), [[0] * len(BUCKETS), 0.0, 0])
+            for i, n in enumerate(buckets[:len(BUCKETS)]):
+                acumulado[0][i] += n
+            acumulado[1] += suma
+            acumulado[2] += total
+    return contadores, histogramas
+
+
+def _etiquetas(**etiquetas):
+    partes = []
+    for nombre, valor in etiquetas.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def exponer(gauges=()):
+    """Texto de exposición de Prometheus.
+
+    ``gauges`` es una lista ``[(nombre, ayuda, [(etiquetas, valor)])]``
+    con los valores calculados en el momento del scrape.
+    """
+    contadores, histogramas = recolectar()
+    lineas = [
+        '# HELP sfv_requests_total Llamadas a la API del SFV por endpoint y estado.',
+        '# TYPE sfv_requests_total counter',
+    ]
+    for (method, endpoint, status), n in sorted(contadores.items()):
+        lineas.append(f'sfv_requests_total{_etiquetas(method=method, endpoint=endpoint, status=status)} {n}')
+
+    lineas += [
+        '# HELP sfv_request_duration_seconds Latencia de las llamadas a la API del SFV.',
+        '# TYPE sfv_request_duration_seconds histogram',
+    ]
+    for (method, endpoint), (buckets, suma, total) in sorted(histogramas.items()):
+        acumulado = 0
+        for limite, n in zip(BUCKETS, buckets):
+            acumulado += n
+            etiquetas = _etiquetas(method=method, endpoint=endpoint, le=limite)
+            lineas.append(f'sfv_request_duration_seconds_bucket{etiquetas} {acumulado}')
+        etiquetas = _etiquetas(method=method, endpoint=endpoint, le='+Inf')
+        lineas.append(f'sfv_request_duration_seconds_bucket{etiquetas} {total}')
+        etiquetas = _etiquetas(method=method, endpoint=endpoint)
+        lineas.append(f'sfv_request_duration_seconds_sum{etiquetas} {suma:.6f}')
+        lineas.append(f'sfv_request_duration_seconds_count{etiquetas} {total}')
+
+    for nombre, ayuda, valores in gauges:
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} gauge']
+        for etiquetas, valor in valores:
+            lineas.append(f'{nombre}{_etiquetas(**etiquetas) if etiquetas else ""} {valor}')
+    return '\n'.join(lineas) + '\n'
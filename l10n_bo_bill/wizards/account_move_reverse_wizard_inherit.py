@@ -1,55 +1,95 @@
-from odoo import models, fields, api
-from odoo.exceptions import UserError, ValidationError
-import requests
+from odoo import models, fields
+from odoo.exceptions import UserError
 import logging
 
 _logger = logging.getLogger(__name__)
 
+
 class AccountMoveReversal(models.TransientModel):
     _inherit = "account.move.reversal"
     _description = "Account move reversal inherit"
 
-    
+
     def get_invoice_type(self):
         self.inv_type = self._context.get('inv_type')
     inv_type = fields.Boolean(compute="get_invoice_type")
 
-    def reverse_moves(self, *args, **kwargs):
-        res = super(AccountMoveReversal, self).reverse_moves(*args, **kwargs)
-
-        active_ids = self.env.context.get('active_ids', [])
-        facturas = self.env['account.move'].browse(active_ids)
-
-        for factura in facturas:
-            if not factura.l10n_bo_cuf or not factura.l10n_bo_invoice_number:
-                raise UserError(f"La factura {factura.name} no tiene CUF o número de factura asignado.")
+    motivo_anulacion = fields.Selection(
+        selection='_get_motivos_anulacion',
+        string="Motivo de Anulación",
+        default=lambda self: self._default_motivo_anulacion(),
+        help="Motivo informado al SFV al anular las facturas."
+    )
 
-            payload = {
-                "cuf": factura.l10n_bo_cuf,
-                "numeroFactura": int(factura.l10n_bo_invoice_number),
-                "anulacionMotivo": 1,  # Aquí podrías usar cancellation_reason_id.id si lo haces dinámico
-                "idPuntoVenta": 1,
-                "idSucursal": 1
-            }
+    def _get_motivos_anulacion(self):
+        return self.env['l10n_bo_bill.catalogo']._get_selection('motivo_anulacion')
 
-            api_url = factura._get_api_url()
-            url = f"{api_url}/factura/anular"
+    def _default_motivo_anulacion(self):
+        motivos = self._get_motivos_anulacion()
+        return motivos[0][0] if motivos else False
 
-            try:
-                response = requests.post(url, json=payload, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-
-                if data.get('codigoEstado') != "905":
-                    raise UserError(f"No se confirmó la anulación en la API. Estado: {data.get('codigoEstado')}")
+    def reverse_moves(self, *args, **kwargs):
+        """Revierte las facturas en Odoo y luego las anula en el SFV.
 
-                # 🔹 Marcar la factura como anulada
-                factura.write({'is_cancelled': True})
+        La reversión se hace primero dentro de un savepoint: si Odoo no puede
+        revertir (fecha de bloqueo, líneas conciliadas...) no se llama al SFV.
+        Si el SFV rechaza alguna, se deshacen las reversiones y se rehacen
+        solo las de las anuladas; si esa segunda pasada falla, se revierte la
+        anulación en el SFV. El resultado de cada factura se informa en una
+        notificación.
+        """
+        ya_anuladas = self.move_ids.filtered('is_cancelled')
+        if ya_anuladas:
+            nombres = ", ".join(ya_anuladas.mapped('name'))
+            raise UserError(f"Las facturas ya están anuladas en el SFV: {nombres}")
+        facturas = self.move_ids
+        if not facturas:
+            return super(AccountMoveReversal, self).reverse_moves(*args, **kwargs)
+        sin_cuf = facturas.filtered(lambda f: not f.l10n_bo_cuf or not f.l10n_bo_invoice_number)
+        if sin_cuf:
+            nombres = ", ".join(sin_cuf.mapped('name'))
+            raise UserError(f"Las facturas no tienen CUF o número de factura asignado: {nombres}")
+        if not self.motivo_anulacion:
+            raise UserError("Seleccione el motivo de anulación.")
 
-                _logger.info(f"Factura {factura.name} anulada correctamente en la API.")
+        savepoint = self.env.cr.savepoint()
+        try:
+            res = super(AccountMoveReversal, self).reverse_moves(*args, **kwargs)
+        except Exception:
+            savepoint.close(rollback=True)
+            raise
+        errores = facturas._anular_en_sfv(int(self.motivo_anulacion))
+        if not errores:
+            savepoint.close()
+            return res
 
-            except requests.exceptions.RequestException as e:
-                _logger.error(f"Error al anular la factura {factura.name}: {e}")
-                raise UserError(f"Error al anular la factura en la API: {e}")
+        # Se deshacen todas las reversiones (y las marcas de anulación) y se
+        # rehacen solo las de las facturas que el SFV anuló
+        savepoint.close(rollback=True)
+        anuladas = facturas.filtered(lambda f: f.id not in errores)
+        res = {'type': 'ir.actions.act_window_close'}
+        if anuladas:
+            anuladas.write({'is_cancelled': True})
+            self.move_ids = anuladas
+            try:
+                with self.env.cr.savepoint():
+                    res = super(AccountMoveReversal, self).reverse_moves(*args, **kwargs)
+            except Exception as e:
+                # No se propaga: el rollback descartaría también la reversión en el SFV
+                _logger.exception("No se pudieron revertir en Odoo las facturas anuladas en el SFV")
+                anuladas.revertir_anulacion()
+                errores.update({factura.id: f"No se pudo revertir en Odoo, anulación revertida en el SFV: {e}" for factura in anuladas})
+                anuladas = anuladas.browse()
 
-        return res
\ No newline at end of file
+        detalle = "\n".join(f"- {factura.name}: {errores[factura.id]}" for factura in facturas if factura.id in errores)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': "Anulación de facturas",
+                'message': f"Facturas anuladas: {len(anuladas)}. Con error: {len(errores)}.\n{detalle}",
+                'type': 'warning',
+                'sticky': True,
+                'next': res,
+            },
+        }
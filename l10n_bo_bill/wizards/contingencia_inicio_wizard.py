@@ -1,6 +1,7 @@
-from odoo import models, fields, api
-from odoo.exceptions import UserError, ValidationError
+from odoo import models, fields
+from odoo.exceptions import UserError
 import requests
+from ..tools import sfv_client
 import logging
 from datetime import timedelta
 
@@ -8,6 +9,7 @@ from datetime import timedelta
 _logger = logging.getLogger(__name__)
 class ContingenciaInicioWizard(models.TransientModel):
     _name = 'contingencia.inicio.wizard'
+    _inherit = 'l10n_bo_bill.sfv_mixin'
     _description = 'Inicio de Contingencia'
 
     codigo_evento = fields.Selection(
@@ -19,46 +21,27 @@ class ContingenciaInicioWizard(models.TransientModel):
 
     descripcion = fields.Char(string="Descripción", default="CORTE DEL SERVICIO DE INTERNET")
     
-    def _get_api_url(self):
-        direccion_apis = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
-
-        if not direccion_apis:
-            raise UserError("No se encontró una configuración de la API activa.")
-        
-        if len(direccion_apis) > 1:
-            raise UserError("Hay más de una dirección de API activa. Por favor, verifica la configuración.")
-
-        return direccion_apis.url
-
-    
     def _get_eventos_significativos(self):
-        base_url = self.env['account.move']._get_api_url()
-        url = f"{base_url}/parametro/eventos-significativos"
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            eventos = response.json()
-            return [
-                (str(e.get("codigoClasificador")), f"{e.get('codigoClasificador')} - {e.get('descripcion')}")
-                for e in eventos if e.get("codigoClasificador")
-            ]
-        except Exception as e:
-            _logger.error(f"Error obteniendo eventos significativos: {e}")
-            return []
+        return self.env['l10n_bo_bill.catalogo']._get_selection('evento')
 
     def confirmar_contingencia(self):
         base_url = self._get_api_url()
         url = f"{base_url}/contingencia/registrar-inicio-evento"
 
+        # El evento se registra para el punto de venta de la factura activa
+        factura = self.env['account.move'].browse(self.env.context.get('active_id'))
+        selling_point_id = factura.l10n_bo_selling_point.id
+        lane = self.env['selling_point']._get_lane(selling_point_id)
+
         payload = {
-            "idPuntoVenta": 1,
-            "idSucursal": 1,
+            "idPuntoVenta": lane['id_punto_venta'],
+            "idSucursal": lane['id_sucursal'],
             "codigoEvento": int(self.codigo_evento),
             "descripcion": self.descripcion
         }
 
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = sfv_client.post(url, json=payload)
             response.raise_for_status()
             data = response.json()
 
@@ -66,20 +49,16 @@ class ContingenciaInicioWizard(models.TransientModel):
                 raise UserError("No se registró el evento correctamente.")
 
             # ✅ Marcar contingencia
-            direccion_api = self.env['l10n_bo_bill.direccion_api'].search([('activo', '=', True)], limit=1)
-            if not direccion_api:
-                raise UserError("No se encontró dirección API activa.")
-            direccion_api.write({
+            self.env['selling_point']._registro_contingencia(selling_point_id).write({
                 'contingencia': True,
                 'evento_id': data.get("idEvento")
             })
+            # La numeración local continúa desde la última factura emitida en línea
+            self.env['account.move']._sincronizar_secuencia_contingencia(selling_point_id)
 
             # ✅ Emitir solo la factura activa
-            factura_id = self.env.context.get('active_id')
-            if factura_id:
-                factura = self.env['account.move'].browse(factura_id)
-                if factura.state == 'draft' and factura.move_type == 'out_invoice':
-                    factura.envio_sfv()
+            if factura and factura.state == 'draft' and factura.move_type == 'out_invoice':
+                factura.envio_sfv()
                     
             self._crear_cron_fin_contingencia()
 